@@ -0,0 +1,151 @@
+"""Сводка активности групп для каталога /groups/.
+
+GroupActivity хранит число постов автора в группе по часам. Создание,
+удаление и перенос поста меняют одну строку сводки и счётчики
+GroupStats, поэтому каталог читает только GroupStats. Окна «за сутки»
+и «за неделю» со временем устаревают: их пересчитывает по сводке
+команда compact_group_activity, заодно сворачивая часы старше недели
+в одну строку на автора.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import GroupActivity, GroupStats
+from .timeline import chunked
+
+# Час, в который сворачиваются строки старше недели
+LIFETIME = 0
+DAY = 24
+WEEK = 7 * DAY
+
+
+def hour_of(moment):
+    return int(moment.timestamp()) // 3600
+
+
+def window_deltas(pub_date, delta, now=None):
+    """Сдвиги окон активности для поста с датой pub_date."""
+    age = hour_of(now or timezone.now()) - hour_of(pub_date)
+    deltas = {}
+    if age < DAY:
+        deltas['posts_24h'] = delta
+    if age < WEEK:
+        deltas['posts_7d'] = delta
+    return deltas
+
+
+def add_post(group_id, author_id, pub_date):
+    rows = GroupActivity.objects.filter(group_id=group_id, author_id=author_id)
+    new_author = not rows.exists()
+    hour = hour_of(pub_date)
+    if not rows.filter(hour=hour).update(posts_count=F('posts_count') + 1):
+        try:
+            with transaction.atomic():
+                GroupActivity.objects.create(
+                    group_id=group_id, author_id=author_id, hour=hour,
+                    posts_count=1)
+        except IntegrityError:
+            # Строку этого часа только что создал параллельный запрос
+            rows.filter(hour=hour).update(posts_count=F('posts_count') + 1)
+    GroupStats.objects.bump(group_id, authors_count=int(new_author),
+                            **window_deltas(pub_date, 1))
+
+
+def remove_post(group_id, author_id, pub_date):
+    rows = GroupActivity.objects.filter(group_id=group_id, author_id=author_id)
+    decrement = {'posts_count': F('posts_count') - 1}
+    # Час поста мог быть уже свёрнут в строку LIFETIME
+    removed = (
+        rows.filter(hour=hour_of(pub_date), posts_count__gt=0).update(
+            **decrement)
+        or rows.filter(hour=LIFETIME, posts_count__gt=0).update(**decrement))
+    if not removed:
+        return
+    rows.filter(posts_count=0).delete()
+    GroupStats.objects.bump(group_id, authors_count=-int(not rows.exists()),
+                            **window_deltas(pub_date, -1))
+
+
+def add_counts(hours):
+    """Учитывает пачку постов: hours — Counter по (группа, автор, час).
+
+    Окна и число авторов GroupStats не трогает: их после загрузки
+    пересчитывает compact_group_activity.
+    """
+    for chunk in chunked(list(hours.items())):
+        counts = dict(chunk)
+        existing = [
+            row for row in GroupActivity.objects.filter(
+                group_id__in={group_id for group_id, _, _ in counts},
+                author_id__in={author_id for _, author_id, _ in counts},
+                hour__in={hour for _, _, hour in counts})
+            if (row.group_id, row.author_id, row.hour) in counts
+        ]
+        for row in existing:
+            row.posts_count += counts.pop(
+                (row.group_id, row.author_id, row.hour))
+        GroupActivity.objects.bulk_update(existing, ['posts_count'])
+        GroupActivity.objects.bulk_create(
+            GroupActivity(group_id=group_id, author_id=author_id, hour=hour,
+                          posts_count=count)
+            for (group_id, author_id, hour), count in counts.items())
+
+
+def fold(now=None):
+    """Сворачивает часы старше недели в строки LIFETIME."""
+    cutoff = hour_of(now or timezone.now()) - WEEK
+    old = GroupActivity.objects.filter(hour__gt=LIFETIME, hour__lte=cutoff)
+    totals = old.order_by().values_list('group_id', 'author_id').annotate(
+        Sum('posts_count'))
+    folded = 0
+    with transaction.atomic():
+        for chunk in chunked(list(totals)):
+            counts = {(group_id, author_id): count
+                      for group_id, author_id, count in chunk}
+            lifetime = {
+                (row.group_id, row.author_id): row
+                for row in GroupActivity.objects.filter(
+                    hour=LIFETIME,
+                    group_id__in={group_id for group_id, _ in counts},
+                    author_id__in={author_id for _, author_id in counts})
+                if (row.group_id, row.author_id) in counts
+            }
+            for key, row in lifetime.items():
+                row.posts_count += counts.pop(key)
+            GroupActivity.objects.bulk_update(
+                lifetime.values(), ['posts_count'])
+            GroupActivity.objects.bulk_create(
+                GroupActivity(group_id=group_id, author_id=author_id,
+                              hour=LIFETIME, posts_count=count)
+                for (group_id, author_id), count in counts.items())
+            folded += len(chunk)
+        old.delete()
+    return folded
+
+
+@transaction.atomic
+def recount(stats, now=None):
+    """Пересчитывает окна и число авторов для пачки GroupStats."""
+    current = hour_of(now or timezone.now())
+    group_ids = [row.group_id for row in stats]
+    rows = GroupActivity.objects.filter(group_id__in=group_ids).order_by()
+    windows = {
+        group_id: (posts_24h or 0, posts_7d or 0)
+        for group_id, posts_24h, posts_7d in rows.filter(
+            hour__gt=current - WEEK).values_list('group_id').annotate(
+            posts_24h=Sum('posts_count', filter=Q(hour__gt=current - DAY)),
+            posts_7d=Sum('posts_count'))
+    }
+    authors = dict(rows.values_list('group_id').annotate(
+        Count('author_id', distinct=True)))
+    stale = []
+    for row in stats:
+        actual = (*windows.get(row.group_id, (0, 0)),
+                  authors.get(row.group_id, 0))
+        if (row.posts_24h, row.posts_7d, row.authors_count) != actual:
+            row.posts_24h, row.posts_7d, row.authors_count = actual
+            stale.append(row)
+    GroupStats.objects.bulk_update(
+        stale, ['posts_24h', 'posts_7d', 'authors_count'])
+    return len(stale)
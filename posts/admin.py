@@ -1,15 +1,138 @@
+import os
+
 from django.contrib import admin
-from .models import Post, Group, Comment, Follow
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from . import search
+from .models import Post, Group, Comment, Follow, ProfileCapture
+
+# Дальше этого числа строк отфильтрованный список не считается
+ADMIN_COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator админки без COUNT(*) по всей таблице.
+
+    Без фильтров число строк оценивается по MAX(id) (оценка сверху,
+    если строки удалялись), с фильтрами строки считаются не дальше
+    ADMIN_COUNT_LIMIT.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            last = queryset.model._default_manager.aggregate(
+                last=Max('pk'))['last']
+            return last or 0
+        return queryset.order_by().values('pk')[:ADMIN_COUNT_LIMIT].count()
 
 
-class PostAdmin(admin.ModelAdmin):
+class FastChangeListAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Не считаем второй раз всю таблицу ради «N из M»
+    show_full_result_count = False
+
+
+class PostAdmin(FastChangeListAdmin):
     list_display = ('text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    autocomplete_fields = ('author', 'group')
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE '%...%' по тексту ищем по индексу FTS5
+        if not search_term:
+            return queryset, False
+        return search.matching(queryset, search_term), False
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('title', 'slug')
+    search_fields = ('title', 'slug')
+    prepopulated_fields = {'slug': ('title',)}
+
+
+class CommentAdmin(FastChangeListAdmin):
+    list_display = ('text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    # Новые комментарии первыми по первичному ключу, а не по created
+    ordering = ('-id',)
+    autocomplete_fields = ('author',)
+    raw_id_fields = ('post',)
+
+
+class FollowAdmin(FastChangeListAdmin):
+    list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    ordering = ('-id',)
+    autocomplete_fields = ('user', 'author')
+
+
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    list_display = ('created', 'view', 'path', 'user', 'duration_ms',
+                    'samples', 'queries')
+    list_select_related = ('user',)
+    list_filter = ('view',)
+    date_hierarchy = 'created'
+    # Снимки пишет только ProfilingMiddleware
+    readonly_fields = ('created', 'path', 'view', 'user', 'duration_ms',
+                       'samples', 'queries', 'stacks_file',
+                       'sql_timeline_file')
+    fields = readonly_fields
+    # Файлы лежат вне MEDIA_ROOT: ссылки ведут на download
+    files = ('stacks', 'sql_timeline')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/<str:field>/',
+                 self.admin_site.admin_view(self.download),
+                 name='posts_profilecapture_download'),
+            *super().get_urls(),
+        ]
+
+    def download(self, request, pk, field):
+        if field not in self.files:
+            raise Http404
+        capture = get_object_or_404(ProfileCapture, pk=pk)
+        if not self.has_view_permission(request, capture):
+            raise PermissionDenied
+        file = getattr(capture, field)
+        return FileResponse(file.open('rb'), as_attachment=True,
+                            filename=os.path.basename(file.name))
+
+    def file_link(self, capture, field):
+        url = reverse('admin:posts_profilecapture_download',
+                      kwargs={'pk': capture.pk, 'field': field})
+        return format_html('<a href="{}">{}</a>', url,
+                           os.path.basename(getattr(capture, field).name))
+
+    def stacks_file(self, capture):
+        return self.file_link(capture, 'stacks')
+    stacks_file.short_description = 'стеки'
+
+    def sql_timeline_file(self, capture):
+        return self.file_link(capture, 'sql_timeline')
+    sql_timeline_file.short_description = 'SQL по времени'
+
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
-admin.site.register(Comment)
-admin.site.register(Follow)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
+admin.site.register(ProfileCapture, ProfileCaptureAdmin)
@@ -0,0 +1,125 @@
+"""Замер представлений на данных команды seed_benchmark.
+
+Каждый сценарий — запрос к представлению через тестовый Client от
+имени типичного читателя. После прогрева запрос повторяется N раз:
+считаются перцентили времени и число SQL-запросов; пик памяти снимается
+отдельным запросом под tracemalloc, чтобы не искажать время.
+Холодный замер очищает кеш перед каждым запросом: так видна цена
+промаха, которую горячий замер по одним попаданиям скрывает.
+Пишущие сценарии (new_post, add_comment) откатываются в транзакции.
+"""
+import math
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from .metrics import RequestStats
+from .models import AuthorStats, GroupStats, Post
+
+# Доля, на которую p95 и пик памяти могут вырасти без тревоги
+TOLERANCE = 0.2
+
+
+class Scenario:
+    def __init__(self, name, client, url, data=None):
+        self.name = name
+        self.client = client
+        self.url = url
+        self.data = data
+
+    def request(self):
+        if self.data is None:
+            return self.client.get(self.url)
+        with transaction.atomic():
+            response = self.client.post(self.url, self.data)
+            transaction.set_rollback(True)
+        return response
+
+
+def scenarios():
+    """Сценарии по самым нагруженным объектам набора данных."""
+    reader = AuthorStats.objects.select_related('user').order_by(
+        '-following_count').first().user
+    author = AuthorStats.objects.select_related('user').order_by(
+        '-followers_count').first().user
+    group = GroupStats.objects.select_related('group').order_by(
+        '-posts_count').first().group
+    hot_post = Post.objects.select_related('author').order_by(
+        '-comment_count').first()
+    client = Client()
+    client.force_login(reader)
+    post_kwargs = {'username': hot_post.author.username,
+                   'post_id': hot_post.id}
+    return [
+        Scenario('index', client, reverse('index')),
+        Scenario('index_anonymous', Client(), reverse('index')),
+        Scenario('group_posts', client,
+                 reverse('group_detail', kwargs={'slug': group.slug})),
+        Scenario('profile', client,
+                 reverse('profile', kwargs={'username': author.username})),
+        Scenario('post_view', client, reverse('post', kwargs=post_kwargs)),
+        Scenario('follow_index', client, reverse('follow_index')),
+        Scenario('new_post', client, reverse('new_post'),
+                 {'text': 'Запись из замера'}),
+        Scenario('add_comment', client,
+                 reverse('add_comment', kwargs=post_kwargs),
+                 {'text': 'Комментарий из замера'}),
+    ]
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def measure(scenario, requests, warmup, cold=False):
+    for _ in range(warmup):
+        scenario.request()
+    latencies, queries = [], []
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        stats = RequestStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(stats.count_query):
+            response = scenario.request()
+        latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(stats.queries)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'{scenario.name}: {scenario.url} ответил '
+                f'{response.status_code}')
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        scenario.request()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': max(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """Строки о том, что стало хуже базовой линии."""
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            yield (f"{name}: SQL-запросов {base['queries']} → "
+                   f"{result['queries']}")
+        for metric in ('p95_ms', 'peak_kib'):
+            if result[metric] > base[metric] * (1 + tolerance):
+                yield (f'{name}: {metric} {base[metric]} → '
+                       f'{result[metric]}')
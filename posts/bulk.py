@@ -0,0 +1,71 @@
+"""Помощники для массовой загрузки строк через bulk_create."""
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection
+
+
+@contextmanager
+def original_dates(*models):
+    """Отключает auto_now_add, чтобы bulk_create сохранил заданные даты."""
+    fields = [field for model in models for field in model._meta.fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def reset_sequences(*models):
+    """Двигает счётчики первичных ключей после вставки с явными id."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def next_id(model):
+    """Первый свободный id: с него раздаются явные id для bulk_create."""
+    last = model.objects.order_by('-id').values_list('id', flat=True).first()
+    return (last or 0) + 1
+
+
+def keyset(queryset, batch_size):
+    """Пачки строк values() по возрастанию id без OFFSET.
+
+    Каждая пачка — отдельный запрос по индексу первичного ключа, поэтому
+    память и время на пачку не зависят от размера таблицы.
+    """
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield rows
+
+
+@contextmanager
+def deferred_indexes(*models):
+    """Снимает Meta.indexes моделей на время загрузки в транзакции.
+
+    Индексы создаются заново после загрузки, а при ошибке их возвращает
+    откат транзакции. SQL берётся у редактора схемы без входа в него:
+    SQLite не открывает редактор внутри транзакции, хотя сами CREATE и
+    DROP INDEX в ней допустимы.
+    """
+    editor = connection.schema_editor()
+    indexes = [(model, index) for model in models
+               for index in model._meta.indexes]
+    with connection.cursor() as cursor:
+        for model, index in indexes:
+            cursor.execute(str(index.remove_sql(model, editor)))
+    yield
+    with connection.cursor() as cursor:
+        for model, index in indexes:
+            cursor.execute(str(index.create_sql(model, editor)))
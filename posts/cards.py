@@ -0,0 +1,60 @@
+"""Кеш отрисованных карточек постов.
+
+Карточка posts/post_item.html кешируется по (post.id, post.version):
+версию сдвигают правка поста, изменение числа комментариев и
+переименование автора или группы, так что устаревшая карточка просто
+перестаёт запрашиваться. Страница ленты собирается одним
+cache.get_many, отрисовываются только промахи. Кнопка «Редактировать»
+остаётся меткой, её вставляет punch_edit_links для каждого зрителя.
+"""
+import re
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TIMEOUT = 60 * 60 * 24
+
+EDIT_LINK_MARKER = re.compile(
+    r'<!--edit-link:(?P<username>[^:]+):(?P<id>\d+)-->')
+
+
+def card_key(post_id, version):
+    return f'card:{post_id}:{version}'
+
+
+def render_cards(posts):
+    """HTML карточек постов в исходном порядке."""
+    keys = [card_key(post.id, post.version) for post in posts]
+    cached = cache.get_many(keys)
+    missing = {}
+    cards = []
+    for key, post in zip(keys, posts):
+        if key not in cached:
+            missing[key] = render_to_string(
+                'posts/post_item.html', {'post': post})
+        cards.append(cached[key] if key in cached else missing[key])
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    return mark_safe(''.join(cards))
+
+
+def forget(post):
+    cache.delete(card_key(post.id, post.version))
+
+
+def punch_edit_links(html, user):
+    """Вставляет кнопку редактирования в карточки постов пользователя."""
+    username = user.username if user.is_authenticated else None
+
+    def replace(match):
+        if match.group('username') != username:
+            return ''
+        return render_to_string('posts/edit_link.html', {
+            'username': username, 'post_id': match.group('id')})
+    return mark_safe(EDIT_LINK_MARKER.sub(replace, html))
+
+
+def cards_for(posts, user):
+    """Карточки постов для конкретного зрителя."""
+    return punch_edit_links(render_cards(posts), user)
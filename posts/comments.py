@@ -0,0 +1,33 @@
+"""Комментарии поста порциями по ключу (created, id).
+
+Первая порция выводится на странице поста, следующие подгружаются
+HTML-фрагментом post_comments по курсору последнего показанного
+комментария.
+"""
+from .models import Comment
+from .pagination import CursorPage, decode_cursor
+
+COMMENTS_PER_PAGE = 20
+
+
+def comments_page(post_id, cursor=None, per_page=COMMENTS_PER_PAGE,
+                  count=None):
+    """Комментарии после курсора, старые первыми, вместе с авторами.
+
+    Если число комментариев поста известно (count), первая порция
+    остаётся QuerySet и не выбирает лишнюю строку ради has_next.
+    """
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author').only('id', 'text', 'created', 'post', 'author__username'
+                       ).order_by('created', 'id')
+    after = decode_cursor(cursor)
+    if after is None and count is not None:
+        return CursorPage(comments[:per_page], False, count > per_page,
+                          date_field='created')
+    if after is not None:
+        created, comment_id = after
+        comments = comments.filter(created__gte=created).exclude(
+            created=created, id__lte=comment_id)
+    items = list(comments[:per_page + 1])
+    return CursorPage(items[:per_page], after is not None,
+                      len(items) > per_page, date_field='created')
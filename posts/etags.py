@@ -0,0 +1,102 @@
+"""ETag страниц для условных GET (304 Not Modified).
+
+ETag собирается из счётчиков версий, которые уже поддерживаются для
+кешей. Главная берёт версию ленты, страницы группы и автора —
+счётчики GroupStats и AuthorStats и сумму Post.version только своих
+постов, как ленты RSS. В него же
+входит id зрителя: кнопки «Редактировать» и «Подписаться» и меню
+зависят от того, кто смотрит страницу.
+
+Автор с AuthorStats и GroupStats группы, прочитанные ради ETag,
+запоминаются в request, и представления берут их через
+author_with_stats и group_stats без новых запросов.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.shortcuts import get_object_or_404
+
+from . import feed_cache, groups
+from .models import AuthorStats, GroupStats, Post
+
+User = get_user_model()
+
+
+def etag(request, *parts):
+    viewer = request.user.pk if request.user.is_authenticated else 0
+    seed = ':'.join(str(part) for part in (*parts, viewer))
+    return hashlib.md5(seed.encode()).hexdigest()
+
+
+def feed_etag(request):
+    return etag(request, 'index', feed_cache.feed_version())
+
+
+def posts_total(aggregate, **lookups):
+    """Подзапрос с агрегатом по постам, отобранным lookups."""
+    return Subquery(
+        Post.objects.filter(**lookups).order_by().values(*lookups)
+        .annotate(value=aggregate).values('value'))
+
+
+def group_stats(request, group):
+    """GroupStats группы, по возможности уже из request."""
+    stats = getattr(request, 'group_stats', None)
+    if stats is None:
+        stats = GroupStats.objects.for_group(group)
+    return stats
+
+
+def group_etag(request, slug):
+    # Несуществующая группа — сразу 404, без ETag
+    group = groups.get_group_or_404(slug)
+    request.group_stats = GroupStats.objects.filter(group=group).annotate(
+        versions=posts_total(Sum('version'), group=OuterRef('group'))
+    ).first()
+    if request.group_stats is None:
+        return None
+    stats = request.group_stats
+    return etag(request, 'group', slug, group.title, group.description,
+                stats.posts_count, stats.last_post_at, stats.versions)
+
+
+def load_author(request, username, **annotations):
+    """AuthorStats вместе с пользователем одним запросом по индексам."""
+    request.author_stats = AuthorStats.objects.select_related('user').filter(
+        user__username=username).annotate(**annotations).first()
+    return request.author_stats
+
+
+def author_with_stats(request, username):
+    """Пользователь и его AuthorStats, по возможности уже из request."""
+    stats = getattr(request, 'author_stats', None)
+    if stats is not None:
+        return stats.user, stats
+    user = get_object_or_404(User, username=username)
+    return user, AuthorStats.objects.for_user(user)
+
+
+def counters(stats):
+    return stats.posts_count, stats.followers_count, stats.following_count
+
+
+def profile_etag(request, username):
+    stats = load_author(request, username,
+                        latest=posts_total(Max('pub_date'),
+                                           author=OuterRef('user')),
+                        versions=posts_total(Sum('version'),
+                                             author=OuterRef('user')))
+    if stats is None:
+        return None
+    return etag(request, 'profile', username, stats.user.get_full_name(),
+                stats.latest, stats.versions, *counters(stats))
+
+
+def post_etag(request, username, post_id):
+    stats = load_author(request, username, post_version=Subquery(
+        Post.objects.filter(id=post_id).order_by().values('version')))
+    if stats is None or stats.post_version is None:
+        return None
+    return etag(request, 'post', username, post_id, stats.post_version,
+                *counters(stats))
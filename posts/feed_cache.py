@@ -0,0 +1,120 @@
+"""Кеш отрисованных страниц ленты с версионированием.
+
+Ключ страницы содержит вариант (страница или курсор) и глобальную
+версию ленты, которую сдвигают публикация, правка и удаление поста.
+Версия ленты — это версия тега 'posts' кеша страниц для анонимов:
+один счётчик сбрасывает и ленту, и закешированную главную. Страницы
+групп, авторов и постов помечены своими тегами, и forget_posts
+сбрасывает только те, где виден изменённый пост.
+Устаревшую запись отдаёт всем, кроме одного воркера: он берёт
+блокировку через cache.add и пересчитывает страницу
+(stale-while-revalidate с single-flight).
+
+Число постов для номеров страниц тоже лежит в кеше: COUNT(*) нужен
+только при первом обращении, дальше счётчик двигают сигналы.
+
+Карточки собираются из кеша cards, кнопка «Редактировать» остаётся
+в HTML меткой и вставляется для зрителя через cards.punch_edit_links.
+"""
+import time
+
+from django.core.cache import cache
+
+from . import page_cache
+from .cards import render_cards
+from .models import Post
+
+FEED_TAG = 'posts'
+COUNT_KEY = 'feed:count'
+# Сколько секунд страница считается свежей
+FRESH_TIMEOUT = 60
+# Сколько живёт устаревшая копия, которую можно отдать во время пересчёта
+STALE_TIMEOUT = 60 * 60 * 24
+LOCK_TIMEOUT = 10
+
+
+def feed_version():
+    return page_cache.tag_version(FEED_TAG)
+
+
+def bump_feed_version():
+    page_cache.invalidate(FEED_TAG)
+
+
+def forget(usernames=(), slugs=(), post_ids=()):
+    """Сдвигает версию ленты и теги страниц авторов, групп и постов."""
+    tags = {FEED_TAG}
+    for template, values in (('author:{}', usernames), ('group:{}', slugs),
+                             ('post:{}', post_ids)):
+        tags.update(template.format(value) for value in values
+                    if value is not None)
+    page_cache.invalidate(*tags)
+
+
+def forget_posts(posts):
+    """Сбрасывает страницы, на которых видны посты из QuerySet posts."""
+    rows = list(posts.order_by().values_list(
+        'id', 'author__username', 'group__slug'))
+    forget(usernames=(username for _, username, _ in rows),
+           slugs=(slug for _, _, slug in rows),
+           post_ids=(post_id for post_id, _, _ in rows))
+
+
+def post_count():
+    count = cache.get(COUNT_KEY)
+    if count is None:
+        count = Post.objects.count()
+        # Срок жизни страхует от расхождения с таблицей после гонки
+        cache.add(COUNT_KEY, count, STALE_TIMEOUT)
+    return count
+
+
+def adjust_post_count(delta):
+    try:
+        cache.incr(COUNT_KEY, delta)
+    except ValueError:
+        pass  # Счётчика нет — его посчитает следующий post_count
+
+
+def reset_post_count():
+    """Забывает счётчик после загрузок мимо сигналов."""
+    cache.delete(COUNT_KEY)
+
+
+def detach(page):
+    """Готовит страницу к кешированию: без ссылок на QuerySet ленты."""
+    page.object_list = list(page.object_list)
+    if page.paginator is not None:
+        page.paginator.num_pages  # считаем, пока запрос ещё доступен
+        page.paginator.object_list = ()
+    return page
+
+
+def cached_page(name, variant, build_page):
+    """Возвращает (page, html) страницы ленты из кеша или строит её."""
+    key = f'feed:{name}:{variant}:{feed_version()}'
+    stale_key = f'feed:{name}:{variant}:latest'
+    hits = cache.get_many([key, stale_key])
+    stale = None
+    if key in hits:
+        fresh_until, entry = hits[key]
+        if time.time() < fresh_until:
+            return entry
+        stale = entry
+    elif stale_key in hits:
+        stale = hits[stale_key]
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not locked and stale is not None:
+        return stale
+    try:
+        page = detach(build_page())
+        entry = (page, render_cards(page))
+        cache.set_many({
+            key: (time.time() + FRESH_TIMEOUT, entry),
+            stale_key: entry,
+        }, STALE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return entry
@@ -0,0 +1,158 @@
+"""Ленты RSS и Atom: общая, сообществ и авторов.
+
+Записи берутся из Post.objects.for_feed() — автор и группа одним JOIN —
+не больше FEED_ITEMS штук. Готовый XML кешируется по ключу из даты
+последнего поста, числа постов и суммы их Post.version: правка поста,
+переименование автора или группы двигают версию только своих постов.
+Те же значения дают Last-Modified и ETag, поэтому бот, опрашивающий
+неизменную ленту, получает 304 после одного агрегирующего запроса, как
+бы ни менялось остальное на сайте.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from django.views.decorators.http import condition
+
+from . import groups
+from .models import Post
+
+User = get_user_model()
+
+FEED_ITEMS = 50
+FEED_TIMEOUT = 60 * 60
+
+
+class PostsFeed(Feed):
+    title = 'Yatube: последние записи'
+    description = 'Новые записи всех авторов'
+
+    def link(self):
+        return reverse('index')
+
+    def items(self):
+        return Post.objects.for_feed()[:FEED_ITEMS]
+
+    def item_title(self, post):
+        return Truncator(post.text).words(10)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('post', kwargs={'username': post.author.username,
+                                       'post_id': post.id})
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_author_name(self, post):
+        return post.author.username
+
+    def item_categories(self, post):
+        return (post.group.title,) if post.group else ()
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return groups.get_group_or_404(slug)
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('group_detail', kwargs={'slug': group.slug})
+
+    def items(self, group):
+        return Post.objects.for_feed().filter(group=group)[:FEED_ITEMS]
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, author):
+        return f'Yatube: записи {author.username}'
+
+    def description(self, author):
+        return f'Новые записи пользователя {author.username}'
+
+    def link(self, author):
+        return reverse('profile', kwargs={'username': author.username})
+
+    def items(self, author):
+        return Post.objects.for_feed().filter(author=author)[:FEED_ITEMS]
+
+
+class PostsAtomFeed(PostsFeed):
+    feed_type = Atom1Feed
+    subtitle = PostsFeed.description
+
+
+class GroupAtomFeed(GroupFeed):
+    feed_type = Atom1Feed
+    subtitle = GroupFeed.description
+
+
+class AuthorAtomFeed(AuthorFeed):
+    feed_type = Atom1Feed
+    subtitle = AuthorFeed.description
+
+
+def feed_state(request, slug=None, username=None):
+    """Дата последнего поста ленты и ETag по её постам, один запрос."""
+    if not hasattr(request, 'feed_state'):
+        posts = Post.objects.order_by()
+        if slug is not None:
+            posts = posts.filter(group=groups.get_group_or_404(slug))
+        if username is not None:
+            posts = posts.filter(author__username=username)
+        state = posts.aggregate(latest=Max('pub_date'), count=Count('id'),
+                                versions=Sum('version'))
+        latest = state['latest']
+        etag = None
+        if latest is not None:
+            seed = (f"{request.path}:{latest}:{state['count']}:"
+                    f"{state['versions']}")
+            etag = hashlib.md5(seed.encode()).hexdigest()
+        request.feed_state = latest, etag
+    return request.feed_state
+
+
+def feed_last_modified(request, **kwargs):
+    return feed_state(request, **kwargs)[0]
+
+
+def feed_etag(request, **kwargs):
+    return feed_state(request, **kwargs)[1]
+
+
+def feed_view(feed_class):
+    """Представление ленты с условным GET и кешем готового XML."""
+    feed = feed_class()
+
+    @condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+    def view(request, **kwargs):
+        etag = feed_state(request, **kwargs)[1]
+        if etag is None:
+            # Пустая лента или 404 — строим без кеша
+            return feed(request, **kwargs)
+        key = f'syndication:{etag}'
+        cached = cache.get(key)
+        if cached is None:
+            response = feed(request, **kwargs)
+            cached = response['Content-Type'], response.content
+            cache.set(key, cached, FEED_TIMEOUT)
+        content_type, content = cached
+        return HttpResponse(content, content_type=content_type)
+    return view
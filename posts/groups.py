@@ -0,0 +1,36 @@
+"""Кеш групп по slug в памяти процесса.
+
+Страница группы не ходит в базу за строкой Group. Сохранение и удаление
+группы очищают кеш своего процесса через сигналы, а в остальных
+процессах запись устаревает не позже чем через CACHE_TIMEOUT секунд.
+"""
+import threading
+import time
+
+from django.http import Http404
+
+from .models import Group
+
+CACHE_TIMEOUT = 60
+
+_groups = {}
+_lock = threading.Lock()
+
+
+def get_group_or_404(slug):
+    now = time.monotonic()
+    entry = _groups.get(slug)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    try:
+        group = Group.objects.get(slug=slug)
+    except Group.DoesNotExist:
+        raise Http404('Группа не найдена')
+    with _lock:
+        _groups[slug] = (now + CACHE_TIMEOUT, group)
+    return group
+
+
+def forget():
+    with _lock:
+        _groups.clear()
@@ -0,0 +1,63 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from posts import benchmark
+from posts.models import Post
+
+COLUMNS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'peak_kib')
+
+
+class Command(BaseCommand):
+    help = ('Замеряет представления на данных seed_benchmark: перцентили '
+            'времени, SQL-запросы и пик памяти с горячим кешем и с '
+            'пустым (строки :cold); сравнивает с базовой линией и падает '
+            'при регрессии')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO',
+                            help='Замерить только эти сценарии')
+        parser.add_argument('--baseline',
+                            help='JSON с базовой линией для сравнения')
+        parser.add_argument('--save', help='Куда записать результаты JSON')
+        parser.add_argument('--tolerance', type=float,
+                            default=benchmark.TOLERANCE)
+
+    def handle(self, *args, requests, warmup, only, baseline, save,
+               tolerance, **options):
+        if not Post.objects.exists():
+            raise CommandError('Сначала заполните базу: seed_benchmark')
+        self.stdout.write('{:<21}'.format('scenario') + ''.join(
+            f'{column:>10}' for column in COLUMNS))
+        results = {}
+        # Как в продакшене: без DEBUG и без выборочной проверки SQL
+        with override_settings(
+                DEBUG=False, QUERY_INSPECTOR_SAMPLE_RATE=0,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for scenario in benchmark.scenarios():
+                if only and scenario.name not in only:
+                    continue
+                for cold, name in ((False, scenario.name),
+                                   (True, f'{scenario.name}:cold')):
+                    try:
+                        result = benchmark.measure(
+                            scenario, requests, warmup, cold=cold)
+                    except RuntimeError as error:
+                        raise CommandError(error)
+                    results[name] = result
+                    self.stdout.write(f'{name:<21}' + ''.join(
+                        f'{result[column]:>10}' for column in COLUMNS))
+        if save:
+            with open(save, 'w') as file:
+                json.dump(results, file, indent=2)
+        if baseline:
+            with open(baseline) as file:
+                problems = list(benchmark.regressions(
+                    results, json.load(file), tolerance))
+            if problems:
+                raise CommandError('Регрессии:\n' + '\n'.join(problems))
+            self.stdout.write('Регрессий нет')
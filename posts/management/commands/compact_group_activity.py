@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import activity
+from posts.models import GroupStats
+
+
+class Command(BaseCommand):
+    help = ('Сворачивает почасовую активность групп старше недели и '
+            'пересчитывает окна активности GroupStats; запускать раз в час')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        folded = activity.fold()
+        last_id = 0
+        fixed = 0
+        while True:
+            stats = list(
+                GroupStats.objects.filter(group_id__gt=last_id)
+                .order_by('group_id')
+                .only('group_id', 'posts_24h', 'posts_7d', 'authors_count')
+                [:batch_size])
+            if not stats:
+                break
+            last_id = stats[-1].group_id
+            fixed += activity.recount(stats)
+        self.stdout.write(
+            f'Свёрнуто пар группа-автор: {folded}, обновлено групп: {fixed}')
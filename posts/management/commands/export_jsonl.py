@@ -0,0 +1,79 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts.bulk import keyset
+from posts.models import Comment, Follow, Group, Post
+
+
+def dump(moment):
+    return moment.isoformat() if moment else None
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, посты, комментарии и подписки в JSON Lines: '
+            'одна запись на строку, таблицы читаются пачками по id')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл или - для stdout')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, path, batch_size, **options):
+        self.batch_size = batch_size
+        stream = (sys.stdout if path == '-'
+                  else open(path, 'w', encoding='utf-8'))
+        try:
+            counts = self.export(stream)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        summary = ', '.join(f'{kind} {count}' for kind, count in counts)
+        self.stderr.write(f'Выгружено: {summary}')
+
+    def export(self, stream):
+        # Порядок записей — порядок загрузки: комментарию и подписке
+        # нужны уже загруженные пост и пользователи
+        sections = (
+            ('group', Group.objects.values(
+                'id', 'slug', 'title', 'description')),
+            ('post', Post.objects.values(
+                'id', 'author__username', 'group__slug', 'text', 'pub_date',
+                'image')),
+            ('comment', Comment.objects.values(
+                'id', 'post_id', 'author__username', 'text', 'created')),
+            ('follow', Follow.objects.values(
+                'id', 'user__username', 'author__username')),
+        )
+        counts = []
+        for kind, queryset in sections:
+            record = getattr(self, f'{kind}_record')
+            count = 0
+            for rows in keyset(queryset, self.batch_size):
+                stream.writelines(
+                    json.dumps(record(row), ensure_ascii=False) + '\n'
+                    for row in rows)
+                count += len(rows)
+            counts.append((kind, count))
+        return counts
+
+    def group_record(self, row):
+        return {'type': 'group', 'slug': row['slug'], 'title': row['title'],
+                'description': row['description']}
+
+    def post_record(self, row):
+        return {'type': 'post', 'id': row['id'],
+                'author': row['author__username'],
+                'group': row['group__slug'], 'text': row['text'],
+                'pub_date': dump(row['pub_date']),
+                'image': row['image'] or None}
+
+    def comment_record(self, row):
+        return {'type': 'comment', 'post': row['post_id'],
+                'author': row['author__username'], 'text': row['text'],
+                'created': dump(row['created'])}
+
+    def follow_record(self, row):
+        return {'type': 'follow', 'user': row['user__username'],
+                'author': row['author__username']}
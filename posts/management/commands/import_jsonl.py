@@ -0,0 +1,274 @@
+import collections
+import json
+import sys
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import activity, feed_cache, groups, page_cache, search
+from posts.bulk import (deferred_indexes, next_id, original_dates,
+                        reset_sequences)
+from posts.models import (AuthorStats, Comment, Follow, Group, GroupStats,
+                          Post, TimelineEntry)
+from posts.timeline import chunked
+
+User = get_user_model()
+
+KINDS = ('group', 'post', 'comment', 'follow')
+# Сколько авторов с постами держать в памяти при заполнении лент
+AUTHORS_PER_PASS = 100
+
+
+class Command(BaseCommand):
+    help = ('Загружает группы, посты, комментарии и подписки из JSON Lines '
+            '(формат export_jsonl) пачками bulk_create. Авторы и группы '
+            'ищутся по username и slug, недостающие пользователи создаются '
+            'без пароля, даты постов и комментариев сохраняются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл или - для stdin')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--defer-indexes', action='store_true',
+            help='Снять вторичные индексы и триггеры поиска на время '
+                 'загрузки и построить их заново в конце')
+
+    def handle(self, *args, path, batch_size, defer_indexes, **options):
+        self.batch_size = batch_size
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            with transaction.atomic(), original_dates(Post, Comment):
+                self.prepare()
+                if defer_indexes:
+                    with deferred_indexes(Post, Comment, Follow):
+                        search.drop_triggers()
+                        self.load(stream)
+                    call_command('rebuild_search_index', stdout=self.stdout)
+                else:
+                    self.load(stream)
+                reset_sequences(User, Group, Post, Follow)
+                self.update_stats()
+                self.fill_timelines()
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if self.hours:
+            call_command('compact_group_activity', stdout=self.stdout)
+        if self.loaded['follow']:
+            call_command('recount_follows', stdout=self.stdout)
+        groups.forget()
+        page_cache.invalidate('authors', 'groups')
+        feed_cache.reset_post_count()
+        # Новые посты видны у своих авторов и групп, подписки — в
+        # счётчиках обоих пользователей
+        touched = self.followed.union(self.author_posts, self.followers)
+        feed_cache.forget(
+            usernames=(username for username, user_id in self.users.items()
+                       if user_id in touched),
+            slugs=(slug for slug, group_id in self.groups.items()
+                   if group_id in self.group_posts))
+        self.stdout.write('Загружено: ' + ', '.join(
+            f'{kind} {self.loaded[kind]}' for kind in KINDS))
+
+    def prepare(self):
+        # Словари в памяти вместо запроса на каждую запись
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        self.post_ids = {}
+        self.password = make_password(None)
+        self.next_ids = {model: next_id(model)
+                         for model in (User, Group, Post, Follow)}
+        self.first_post = self.next_ids[Post]
+        self.first_follow = self.next_ids[Follow]
+        self.loaded = collections.Counter()
+        self.author_posts = collections.Counter()
+        self.group_posts = collections.Counter()
+        self.last_post_at = {}
+        self.hours = collections.Counter()
+        self.comments = collections.Counter()
+        self.followed = set()
+        self.followers = set()
+
+    def take_ids(self, model, count):
+        first = self.next_ids[model]
+        self.next_ids[model] += count
+        return range(first, first + count)
+
+    def load(self, stream):
+        """Читает записи и загружает их пачками одного типа."""
+        kind, pending = None, []
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CommandError(f'Строка {number}: не JSON')
+            if not isinstance(record, dict) or record.get('type') not in KINDS:
+                raise CommandError(f'Строка {number}: неизвестная запись')
+            if record['type'] != kind or len(pending) >= self.batch_size:
+                self.flush(kind, pending)
+                kind, pending = record['type'], []
+            pending.append((number, record))
+        self.flush(kind, pending)
+
+    def flush(self, kind, pending):
+        if not pending:
+            return
+        try:
+            getattr(self, f'load_{kind}s')(pending)
+        except KeyError as error:
+            raise CommandError(
+                f'Строки {pending[0][0]}-{pending[-1][0]}: '
+                f'в записи {kind} нет поля {error}')
+        self.loaded[kind] += len(pending)
+
+    def moment(self, number, value):
+        moment = parse_datetime(value or '')
+        if moment is None:
+            raise CommandError(f'Строка {number}: неверная дата {value!r}')
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def ensure_users(self, usernames):
+        missing = sorted(set(usernames) - self.users.keys())
+        ids = self.take_ids(User, len(missing))
+        for chunk in chunked(zip(ids, missing), self.batch_size):
+            User.objects.bulk_create(
+                User(id=user_id, username=username, password=self.password)
+                for user_id, username in chunk)
+        self.users.update(zip(missing, ids))
+
+    def load_groups(self, pending):
+        # Существующие группы не перезаписываются
+        records = {record['slug']: record for _, record in pending
+                   if record['slug'] not in self.groups}
+        ids = self.take_ids(Group, len(records))
+        Group.objects.bulk_create(
+            Group(id=group_id, slug=slug, title=record['title'],
+                  description=record['description'])
+            for group_id, (slug, record) in zip(ids, records.items()))
+        GroupStats.objects.create_empty(ids)
+        self.groups.update(zip(records, ids))
+
+    def load_posts(self, pending):
+        self.ensure_users(record['author'] for _, record in pending)
+        posts = []
+        ids = self.take_ids(Post, len(pending))
+        for (number, record), post_id in zip(pending, ids):
+            group_id = None
+            if record.get('group'):
+                group_id = self.groups.get(record['group'])
+                if group_id is None:
+                    raise CommandError(
+                        f"Строка {number}: нет группы {record['group']!r}")
+            author_id = self.users[record['author']]
+            pub_date = self.moment(number, record['pub_date'])
+            self.post_ids[record['id']] = post_id
+            self.author_posts[author_id] += 1
+            if group_id is not None:
+                self.group_posts[group_id] += 1
+                self.last_post_at[group_id] = max(
+                    pub_date, self.last_post_at.get(group_id, pub_date))
+                self.hours[group_id, author_id,
+                           activity.hour_of(pub_date)] += 1
+            posts.append(Post(id=post_id, text=record['text'],
+                              pub_date=pub_date, author_id=author_id,
+                              group_id=group_id,
+                              image=record.get('image') or ''))
+        Post.objects.bulk_create(posts)
+
+    def load_comments(self, pending):
+        self.ensure_users(record['author'] for _, record in pending)
+        comments = []
+        for number, record in pending:
+            post_id = self.post_ids.get(record['post'])
+            if post_id is None:
+                raise CommandError(
+                    f"Строка {number}: пост {record['post']} не загружен")
+            self.comments[post_id] += 1
+            comments.append(Comment(
+                post_id=post_id, author_id=self.users[record['author']],
+                text=record['text'],
+                created=self.moment(number, record['created'])))
+        Comment.objects.bulk_create(comments)
+
+    def load_follows(self, pending):
+        self.ensure_users(
+            username for _, record in pending
+            for username in (record['user'], record['author']))
+        pairs = [(self.users[record['user']], self.users[record['author']])
+                 for _, record in pending
+                 if record['user'] != record['author']]
+        ids = self.take_ids(Follow, len(pairs))
+        # Уже существующие подписки пропускаются
+        Follow.objects.bulk_create(
+            (Follow(id=follow_id, user_id=user_id, author_id=author_id)
+             for follow_id, (user_id, author_id) in zip(ids, pairs)),
+            ignore_conflicts=True)
+        self.followed.update(author_id for _, author_id in pairs)
+        self.followers.update(user_id for user_id, _ in pairs)
+
+    def update_stats(self):
+        """Сдвигает денормализованные счётчики на загруженные строки.
+
+        Строки AuthorStats и GroupStats, которых ещё нет, посчитаются по
+        таблицам при первом обращении.
+        """
+        Post.objects.bulk_update(
+            [Post(id=post_id, comment_count=count)
+             for post_id, count in self.comments.items()],
+            ['comment_count'], batch_size=self.batch_size)
+        for chunk in chunked(self.author_posts, self.batch_size):
+            stats = list(AuthorStats.objects.filter(user_id__in=chunk))
+            for row in stats:
+                row.posts_count += self.author_posts[row.user_id]
+            AuthorStats.objects.bulk_update(stats, ['posts_count'])
+        for chunk in chunked(self.group_posts, self.batch_size):
+            stats = list(GroupStats.objects.filter(group_id__in=chunk))
+            for row in stats:
+                row.posts_count += self.group_posts[row.group_id]
+                latest = self.last_post_at[row.group_id]
+                if row.last_post_at is None or row.last_post_at < latest:
+                    row.last_post_at = latest
+            GroupStats.objects.bulk_update(
+                stats, ['posts_count', 'last_post_at'])
+        activity.add_counts(self.hours)
+
+    def fill_timelines(self):
+        """Раскладывает загруженное по лентам, как fan_out и pull.
+
+        Новая подписка получает все посты автора, прежняя — только
+        загруженные. Лента заполняется и для авторов сверх
+        TIMELINE_FANOUT_LIMIT: старые даты загруженных постов лежат
+        раньше отметки timeline_synced и catch_up их бы не подтянул.
+        """
+        authors = sorted(self.followed.union(self.author_posts))
+        for chunk in chunked(authors, AUTHORS_PER_PASS):
+            posts = collections.defaultdict(list)
+            for author_id, post_id, pub_date in (
+                    Post.objects.filter(author_id__in=chunk).order_by()
+                    .values_list('author_id', 'id', 'pub_date').iterator()):
+                posts[author_id].append((post_id, pub_date))
+            follows = Follow.objects.filter(author_id__in=chunk).order_by(
+            ).values_list('id', 'user_id', 'author_id').iterator()
+            entries = (
+                TimelineEntry(user_id=user_id, post_id=post_id,
+                              author_id=author_id, pub_date=pub_date)
+                for follow_id, user_id, author_id in follows
+                for post_id, pub_date in posts[author_id]
+                if follow_id >= self.first_follow
+                or post_id >= self.first_post)
+            for batch in chunked(entries, self.batch_size):
+                TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        Follow.objects.filter(id__gte=self.first_follow).update(
+            timeline_synced=Subquery(
+                Post.objects.filter(author_id=OuterRef('author_id'))
+                .order_by('-pub_date').values('pub_date')[:1]))
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = ('Выдаёт подписанный токен для заголовка X-Profile, '
+            'который включает профилирование запроса')
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f'Токен действует {settings.PROFILING_TOKEN_MAX_AGE} секунд')
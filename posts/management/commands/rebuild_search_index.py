@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Post
+from posts.search import FTS_TABLE, TRIGGERS, normalize
+
+
+class Command(BaseCommand):
+    help = ('Заново строит полнотекстовый индекс постов, читая посты '
+            'пачками по id')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    @transaction.atomic
+    def handle(self, *args, batch_size, **options):
+        # Одна транзакция: пост, записанный во время перестройки, не
+        # попадёт в индекс дважды (через триггер и через пачку)
+        with connection.cursor() as cursor:
+            for sql in TRIGGERS:
+                cursor.execute(sql)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        last_id = 0
+        indexed = 0
+        while True:
+            rows = list(
+                Post.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'text')[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            indexed += self.index(rows)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        self.stdout.write(f'Проиндексировано постов: {indexed}')
+
+    def index(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (%s, %s)',
+                [(post_id, normalize(text)) for post_id, text in rows])
+        return len(rows)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts import feed_cache
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает Post.comment_count пачками по id постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        last_id = 0
+        fixed = 0
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'comment_count', 'version')[:batch_size])
+            if not posts:
+                break
+            last_id = posts[-1].id
+            stale = self.recount(posts)
+            if stale:
+                feed_cache.forget_posts(Post.objects.filter(id__in=stale))
+            fixed += len(stale)
+        self.stdout.write(f'Исправлено постов: {fixed}')
+
+    @transaction.atomic
+    def recount(self, posts):
+        counts = dict(
+            Comment.objects.filter(post_id__in=[post.id for post in posts])
+            .order_by().values_list('post_id').annotate(Count('id')))
+        stale = []
+        for post in posts:
+            actual = counts.get(post.id, 0)
+            if post.comment_count != actual:
+                post.comment_count = actual
+                # Карточка кешируется по версии: иначе видна старая цифра
+                post.version += 1
+                stale.append(post)
+        Post.objects.bulk_update(stale, ['comment_count', 'version'])
+        return [post.id for post in stale]
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import AuthorStats, Follow
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает AuthorStats.followers_count и following_count '
+            'пачками по id пользователей')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        last_id = 0
+        fixed = 0
+        while True:
+            stats = list(
+                AuthorStats.objects.filter(user_id__gt=last_id)
+                .order_by('user_id')
+                .only('user_id', 'followers_count', 'following_count')
+                [:batch_size])
+            if not stats:
+                break
+            last_id = stats[-1].user_id
+            fixed += self.recount(stats)
+        self.stdout.write(f'Исправлено пользователей: {fixed}')
+
+    @transaction.atomic
+    def recount(self, stats):
+        user_ids = [row.user_id for row in stats]
+        followers = dict(
+            Follow.objects.filter(author_id__in=user_ids)
+            .order_by().values_list('author_id').annotate(Count('id')))
+        following = dict(
+            Follow.objects.filter(user_id__in=user_ids)
+            .order_by().values_list('user_id').annotate(Count('id')))
+        stale = []
+        for row in stats:
+            actual = (followers.get(row.user_id, 0),
+                      following.get(row.user_id, 0))
+            if (row.followers_count, row.following_count) != actual:
+                row.followers_count, row.following_count = actual
+                stale.append(row)
+        AuthorStats.objects.bulk_update(
+            stale, ['followers_count', 'following_count'])
+        return len(stale)
@@ -0,0 +1,244 @@
+import bisect
+import collections
+import datetime
+import io
+import itertools
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from posts import activity, feed_cache, thumbnails
+from posts.bulk import next_id, original_dates, reset_sequences
+from posts.models import (AuthorStats, Comment, Follow, Group, GroupActivity,
+                          GroupStats, Post, TimelineEntry)
+from posts.timeline import chunked
+
+User = get_user_model()
+
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+FOLLOWS_PER_USER = 10
+GROUP_SHARE = 0.7
+IMAGE_SHARE = 0.1
+IMAGES = 5
+SPAN = datetime.timedelta(days=365)
+WORDS = ('лето', 'море', 'город', 'книга', 'дорога', 'утро', 'кофе',
+         'друзья', 'работа', 'музыка', 'горы', 'снег', 'поезд', 'кот',
+         'дождь', 'вечер', 'фото', 'сад', 'река', 'мост')
+
+
+def power_law(count, exponent=1.1):
+    """Накопленные веса рангов 1..count по закону Ципфа."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Заполняет пустую базу синтетическими данными для benchmark: '
+            'авторы и подписки по степенному закону, горячие посты с '
+            'сотнями комментариев, посты с картинками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=SIZES, default='1k')
+        parser.add_argument('--posts', type=int,
+                            help='Число постов вместо --size')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, size, posts, seed, batch_size, **options):
+        if Post.objects.exists():
+            raise CommandError('Набор создаётся в пустой базе, а посты '
+                               'в ней уже есть')
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.total = posts or SIZES[size]
+        self.now = timezone.now()
+        with transaction.atomic(), original_dates(Post, Comment):
+            users = self.create_users(max(50, self.total // 20))
+            groups = self.create_groups(max(5, self.total // 1000))
+            posts_by_author = self.create_posts(users, groups)
+            followers, following = self.create_follows(
+                users, posts_by_author)
+            self.create_author_stats(
+                users, posts_by_author, followers, following)
+            reset_sequences(User, Group, Post)
+        call_command('compact_group_activity', stdout=self.stdout)
+        feed_cache.reset_post_count()
+        self.stdout.write(
+            f'Создано: пользователей {len(users)}, групп {len(groups)}, '
+            f'постов {self.total}, подписок {sum(followers.values())}')
+
+    def bulk_create(self, model, rows):
+        for chunk in chunked(rows, self.batch_size):
+            model.objects.bulk_create(chunk)
+
+    def pub_date(self, index):
+        """Дата поста с номером index: посты равномерно за SPAN."""
+        return self.now - SPAN + SPAN * (index + 1) / self.total
+
+    def ranking(self, ids):
+        """Случайный порядок популярности и веса его рангов."""
+        ranked = self.random.sample(ids, len(ids))
+        return ranked, power_law(len(ranked))
+
+    def create_users(self, count):
+        first = next_id(User)
+        password = make_password(None)
+        ids = list(range(first, first + count))
+        self.bulk_create(User, (
+            User(id=user_id, username=f'bench{user_id}', password=password)
+            for user_id in ids))
+        return ids
+
+    def create_groups(self, count):
+        first = next_id(Group)
+        ids = list(range(first, first + count))
+        self.bulk_create(Group, (
+            Group(id=group_id, title=f'Сообщество {group_id}',
+                  slug=f'bench-{group_id}',
+                  description=self.text(10, 30))
+            for group_id in ids))
+        return ids
+
+    def text(self, shortest, longest):
+        words = self.random.choices(
+            WORDS, k=self.random.randint(shortest, longest))
+        return ' '.join(words).capitalize()
+
+    def create_images(self):
+        names = []
+        for index in range(IMAGES):
+            name = f'posts/benchmark-{index}.jpg'
+            if not default_storage.exists(name):
+                image = Image.new('RGB', (1280, 853), (
+                    40 * index, 120, 255 - 40 * index))
+                content = io.BytesIO()
+                image.save(content, 'JPEG')
+                default_storage.save(name, ContentFile(content.getvalue()))
+            # Превью готовы заранее: замер не ждёт фоновых потоков
+            thumbnails.backend.create_many(
+                name, thumbnails.RENDITIONS.values())
+            names.append(name)
+        return names
+
+    def comment_counts(self):
+        """Число комментариев по номерам постов: горячие и фоновые."""
+        counts = collections.Counter()
+        hot_size = max(100, min(2000, self.total // 100))
+        for index in self.random.sample(range(self.total),
+                                        max(5, self.total // 10000)):
+            counts[index] += hot_size
+        counts.update(self.random.choices(range(self.total),
+                                          k=self.total // 2))
+        return counts
+
+    def create_posts(self, users, groups):
+        authors, author_weights = self.ranking(users)
+        ranked_groups, group_weights = self.ranking(groups)
+        images = self.create_images()
+        comments = self.comment_counts()
+        first = self.first_post = next_id(Post)
+        posts_by_author = collections.defaultdict(list)
+        group_posts = collections.Counter()
+        last_post_at = {}
+        hours = collections.Counter()
+
+        def rows():
+            for index in range(self.total):
+                author_id, = self.random.choices(
+                    authors, cum_weights=author_weights)
+                group_id = None
+                if self.random.random() < GROUP_SHARE:
+                    group_id, = self.random.choices(
+                        ranked_groups, cum_weights=group_weights)
+                pub_date = self.pub_date(index)
+                posts_by_author[author_id].append(index)
+                if group_id is not None:
+                    group_posts[group_id] += 1
+                    last_post_at[group_id] = pub_date
+                    hours[group_id, author_id,
+                          activity.hour_of(pub_date)] += 1
+                image = None
+                if self.random.random() < IMAGE_SHARE:
+                    image = self.random.choice(images)
+                yield Post(id=first + index, text=self.text(5, 60),
+                           pub_date=pub_date, author_id=author_id,
+                           group_id=group_id, image=image,
+                           comment_count=comments[index])
+
+        self.bulk_create(Post, rows())
+        self.bulk_create(Comment, (
+            Comment(post_id=first + index, author_id=self.random.choice(users),
+                    text=self.text(3, 20),
+                    created=min(self.now, self.pub_date(index)
+                                + datetime.timedelta(minutes=number + 1)))
+            for index, count in comments.items()
+            for number in range(count)))
+        self.bulk_create(GroupStats, (
+            GroupStats(group_id=group_id, posts_count=group_posts[group_id],
+                       last_post_at=last_post_at.get(group_id))
+            for group_id in groups))
+        self.bulk_create(GroupActivity, (
+            GroupActivity(group_id=group_id, author_id=author_id, hour=hour,
+                          posts_count=count)
+            for (group_id, author_id, hour), count in hours.items()))
+        return posts_by_author
+
+    def create_follows(self, users, posts_by_author):
+        """Подписки по степенному закону и готовые ленты подписчиков."""
+        authors, weights = self.ranking(users)
+        follows = []
+        for user_id in users:
+            targets = set(self.random.choices(
+                authors, cum_weights=weights, k=FOLLOWS_PER_USER))
+            targets.discard(user_id)
+            follows.extend((user_id, author_id) for author_id in targets)
+        followers = collections.Counter(
+            author_id for user_id, author_id in follows)
+        following = collections.Counter(
+            user_id for user_id, author_id in follows)
+
+        # Сколько постов автора лежит в ленте подписчика. Как в
+        # продакшене: timeline.pull при подписке копирует всё, что уже
+        # есть, а посты автора сверх TIMELINE_FANOUT_LIMIT после подписки
+        # fan_out не рассылает — их дотягивает catch_up при чтении
+        def delivered(author_id):
+            indexes = posts_by_author.get(author_id, ())
+            if followers[author_id] <= settings.TIMELINE_FANOUT_LIMIT:
+                return len(indexes)
+            return bisect.bisect(indexes, self.random.randrange(self.total))
+
+        cuts = {follow: delivered(follow[1]) for follow in follows}
+
+        def synced(follow):
+            indexes = posts_by_author.get(follow[1], ())
+            cut = cuts[follow]
+            return self.pub_date(indexes[cut - 1]) if cut else None
+
+        self.bulk_create(Follow, (
+            Follow(user_id=user_id, author_id=author_id,
+                   timeline_synced=synced((user_id, author_id)))
+            for user_id, author_id in follows))
+        self.bulk_create(TimelineEntry, (
+            TimelineEntry(user_id=user_id, post_id=self.first_post + index,
+                          author_id=author_id, pub_date=self.pub_date(index))
+            for (user_id, author_id), cut in cuts.items()
+            for index in posts_by_author.get(author_id, ())[:cut]))
+        return followers, following
+
+    def create_author_stats(self, users, posts_by_author, followers,
+                            following):
+        self.bulk_create(AuthorStats, (
+            AuthorStats(user_id=user_id,
+                        posts_count=len(posts_by_author.get(user_id, ())),
+                        followers_count=followers[user_id],
+                        following_count=following[user_id])
+            for user_id in users))
@@ -0,0 +1,286 @@
+"""Метрики запросов в текстовом формате Prometheus.
+
+MetricsMiddleware стоит первой в MIDDLEWARE: на время запроса она
+ставит execute_wrapper на соединение с БД, а обёртка MeteredCache над
+настроенным бэкендом кеша считает попадания и промахи запроса. Итоги
+копятся в памяти процесса с меткой view — именем URL.
+
+Раз в FLUSH_INTERVAL секунд процесс сбрасывает снимок счётчиков в
+METRICS_DIR/<pid>.json, и /metrics складывает снимки всех воркеров.
+Без METRICS_DIR отдаются метрики только своего процесса.
+
+/metrics открыт только адресам из METRICS_ALLOWED_IPS и запросам с
+заголовком «Authorization: Bearer <METRICS_TOKEN>»; по умолчанию закрыт.
+"""
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import Resolver404, resolve
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FLUSH_INTERVAL = 10
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HELP = {
+    'yatube_requests_total': 'Число ответов по представлениям и статусам',
+    'yatube_request_duration_seconds': 'Время ответа представления',
+    'yatube_db_queries_total': 'Число SQL-запросов',
+    'yatube_db_query_seconds_total': 'Суммарное время SQL-запросов',
+    'yatube_cache_hits_total': 'Попадания в кеш',
+    'yatube_cache_misses_total': 'Промахи кеша',
+    'yatube_response_bytes_total': 'Отданные байты тела ответа',
+}
+
+_local = threading.local()
+
+
+class RequestStats:
+    """Счётчики одного запроса."""
+    __slots__ = ('queries', 'sql_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def count_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+
+class Registry:
+    """Счётчики и гистограммы процесса под одной блокировкой."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.counters = {}
+            # Накопительные корзины, затем сумма и число наблюдений
+            self.histograms = {}
+
+    def record(self, view, status, duration, stats, size):
+        labels = (('view', view),)
+        with self.lock:
+            counters = self.counters
+            for name, value in (
+                    ('yatube_db_queries_total', stats.queries),
+                    ('yatube_db_query_seconds_total', stats.sql_time),
+                    ('yatube_cache_hits_total', stats.cache_hits),
+                    ('yatube_cache_misses_total', stats.cache_misses),
+                    ('yatube_response_bytes_total', size)):
+                key = name, labels
+                counters[key] = counters.get(key, 0) + value
+            key = ('yatube_requests_total', labels + (('status', status),))
+            counters[key] = counters.get(key, 0) + 1
+            key = ('yatube_request_duration_seconds', labels)
+            buckets = self.histograms.setdefault(
+                key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            buckets[-2] += duration
+            buckets[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self.counters.items()],
+                'histograms': [[name, labels, list(values)]
+                               for (name, labels), values
+                               in self.histograms.items()],
+            }
+
+    def maybe_flush(self):
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or now - self.flushed_at < FLUSH_INTERVAL:
+            return
+        self.flushed_at = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f'{path}.tmp', path)
+
+
+registry = Registry()
+
+
+def worker_snapshots():
+    """Снимки остальных воркеров из METRICS_DIR."""
+    directory = settings.METRICS_DIR
+    if not directory or not os.path.isdir(directory):
+        return
+    own = f'{os.getpid()}.json'
+    for name in os.listdir(directory):
+        if not name.endswith('.json') or name == own:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                yield json.load(file)
+        except (OSError, ValueError):
+            # Файл пишется прямо сейчас или уже удалён
+            continue
+
+
+def merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = name, tuple(map(tuple, labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = name, tuple(map(tuple, labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def format_labels(labels):
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def render(counters, histograms):
+    lines = []
+    for metric in sorted({name for name, _ in counters}):
+        lines += [f'# HELP {metric} {HELP[metric]}',
+                  f'# TYPE {metric} counter']
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f'{metric}{format_labels(labels)} {value}')
+    for metric in sorted({name for name, _ in histograms}):
+        lines += [f'# HELP {metric} {HELP[metric]}',
+                  f'# TYPE {metric} histogram']
+        for (name, labels), values in sorted(histograms.items()):
+            if name != metric:
+                continue
+            bounds = [*map(str, LATENCY_BUCKETS), '+Inf']
+            for bound, count in zip(bounds, values[:-2] + values[-1:]):
+                bucket_labels = format_labels(labels + (('le', bound),))
+                lines.append(f'{metric}_bucket{bucket_labels} {count}')
+            lines.append(f'{metric}_sum{format_labels(labels)} {values[-2]}')
+            lines.append(f'{metric}_count{format_labels(labels)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def is_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(header, f'Bearer {token}')
+
+
+def metrics_view(request):
+    if not is_allowed(request):
+        return HttpResponseForbidden()
+    counters, histograms = merge(
+        [registry.snapshot(), *worker_snapshots()])
+    return HttpResponse(render(counters, histograms),
+                        content_type=CONTENT_TYPE)
+
+
+def view_name(request):
+    match = request.resolver_match
+    if match is None:
+        # Ответ из кеша страниц отдаётся до разбора URL
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unmatched'
+    return match.url_name or match.view_name
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _local.stats = RequestStats()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats.count_query):
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        duration = time.perf_counter() - start
+        size = 0 if response.streaming else len(response.content)
+        registry.record(view_name(request), response.status_code, duration,
+                        stats, size)
+        registry.maybe_flush()
+        return response
+
+
+_MISSING = object()
+
+
+class MeteredCache:
+    """Обёртка над бэкендом кеша, считающая попадания и промахи запроса.
+
+    Бэкенд задаётся в OPTIONS['BACKEND']; LOCATION, TIMEOUT, KEY_PREFIX
+    и остальные OPTIONS уходят ему как есть. Чтения считаются здесь,
+    остальные методы вызываются у бэкенда напрямую.
+    """
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        backend = import_string(options.pop('BACKEND'))
+        self.backend = backend(location, {**params, 'OPTIONS': options})
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def __contains__(self, key):
+        return key in self.backend
+
+    def count(self, hits, misses):
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.cache_hits += hits
+            stats.cache_misses += misses
+
+    def get(self, key, default=None, version=None):
+        value = self.backend.get(key, _MISSING, version)
+        self.count(int(value is not _MISSING), int(value is _MISSING))
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.backend.get_many(keys, version)
+        self.count(len(values), len(keys) - len(values))
+        return values
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT,
+                   version=None):
+        value = self.get(key, _MISSING, version)
+        if value is not _MISSING:
+            return value
+        if callable(default):
+            default = default()
+        if default is not None:
+            self.backend.add(key, default, timeout, version)
+            # Значение могли записать раньше нас: берём то, что в кеше
+            return self.backend.get(key, default, version)
+        return default
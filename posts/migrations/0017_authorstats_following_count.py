@@ -0,0 +1,29 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+def fill_following_count(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Follow = apps.get_model('posts', 'Follow')
+    counts = Follow.objects.order_by().values_list('user').annotate(
+        models.Count('id'))
+    for user_id, following_count in counts.iterator():
+        AuthorStats.objects.update_or_create(
+            user_id=user_id, defaults={'following_count': following_count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='число подписок'),
+        ),
+        migrations.RunPython(fill_following_count, migrations.RunPython.noop),
+    ]
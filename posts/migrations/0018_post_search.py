@@ -0,0 +1,47 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:40
+
+from django.db import migrations
+
+# ё индексируется как е: unicode61 не снимает диакритику с кириллицы
+INDEXED_TEXT = "replace(replace({}.text, 'ё', 'е'), 'Ё', 'Е')"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_authorstats_following_count'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+                "text, content='posts_post', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')",
+                "CREATE TRIGGER posts_post_fts_insert AFTER INSERT "
+                "ON posts_post BEGIN "
+                "INSERT INTO posts_post_fts(rowid, text) "
+                f"VALUES (new.id, {INDEXED_TEXT.format('new')}); END",
+                "CREATE TRIGGER posts_post_fts_delete AFTER DELETE "
+                "ON posts_post BEGIN "
+                "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+                f"VALUES ('delete', old.id, {INDEXED_TEXT.format('old')}); "
+                "END",
+                "CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text "
+                "ON posts_post BEGIN "
+                "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+                f"VALUES ('delete', old.id, {INDEXED_TEXT.format('old')}); "
+                "INSERT INTO posts_post_fts(rowid, text) "
+                f"VALUES (new.id, {INDEXED_TEXT.format('new')}); END",
+                "INSERT INTO posts_post_fts(rowid, text) "
+                f"SELECT id, {INDEXED_TEXT.format('posts_post')} "
+                "FROM posts_post",
+            ],
+            reverse_sql=[
+                'DROP TRIGGER posts_post_fts_update',
+                'DROP TRIGGER posts_post_fts_delete',
+                'DROP TRIGGER posts_post_fts_insert',
+                'DROP TABLE posts_post_fts',
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_group_stats(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    rows = Post.objects.filter(group__isnull=False).order_by().values_list(
+        'group').annotate(models.Count('id'), models.Max('pub_date'))
+    GroupStats.objects.bulk_create(
+        GroupStats(group_id=group_id, posts_count=posts_count,
+                   last_post_at=last_post_at)
+        for group_id, posts_count, last_post_at in rows.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='число записей')),
+                ('last_post_at', models.DateTimeField(blank=True, null=True, verbose_name='последняя запись')),
+            ],
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def fill_group_activity(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    GroupActivity = apps.get_model('posts', 'GroupActivity')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    Post = apps.get_model('posts', 'Post')
+    GroupStats.objects.bulk_create(
+        GroupStats(group_id=group_id)
+        for group_id in Group.objects.filter(stats__isnull=True).values_list(
+            'id', flat=True).iterator()
+    )
+    current = int(timezone.now().timestamp()) // 3600
+    counts = {}
+    windows = {}
+    posts = Post.objects.filter(group__isnull=False).order_by().values_list(
+        'group_id', 'author_id', 'pub_date')
+    for group_id, author_id, pub_date in posts.iterator():
+        hour = int(pub_date.timestamp()) // 3600
+        age = current - hour
+        # Часы старше недели сразу сворачиваются в hour=0
+        key = (group_id, author_id, hour if age < 7 * 24 else 0)
+        counts[key] = counts.get(key, 0) + 1
+        posts_24h, posts_7d = windows.get(group_id, (0, 0))
+        windows[group_id] = (posts_24h + (age < 24), posts_7d + (age < 7 * 24))
+    GroupActivity.objects.bulk_create(
+        (GroupActivity(group_id=group_id, author_id=author_id, hour=hour,
+                       posts_count=posts_count)
+         for (group_id, author_id, hour), posts_count in counts.items()),
+        batch_size=1000,
+    )
+    authors = {}
+    for group_id, author_id, hour in counts:
+        authors.setdefault(group_id, set()).add(author_id)
+    for stats in GroupStats.objects.filter(group_id__in=authors):
+        stats.posts_24h, stats.posts_7d = windows[stats.group_id]
+        stats.authors_count = len(authors[stats.group_id])
+        stats.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0019_groupstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.PositiveIntegerField()),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='groupstats',
+            name='authors_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='число авторов'),
+        ),
+        migrations.AddField(
+            model_name='groupstats',
+            name='posts_24h',
+            field=models.PositiveIntegerField(default=0, verbose_name='записей за сутки'),
+        ),
+        migrations.AddField(
+            model_name='groupstats',
+            name='posts_7d',
+            field=models.PositiveIntegerField(default=0, verbose_name='записей за неделю'),
+        ),
+        migrations.AddIndex(
+            model_name='groupstats',
+            index=models.Index(fields=['-posts_24h', '-posts_7d', '-posts_count', '-authors_count', 'group'], name='groupstats_activity_idx'),
+        ),
+        migrations.AddField(
+            model_name='groupactivity',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='groupactivity',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Group'),
+        ),
+        migrations.AddIndex(
+            model_name='groupactivity',
+            index=models.Index(fields=['hour'], name='groupactivity_hour_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='groupactivity',
+            constraint=models.UniqueConstraint(fields=('group', 'author', 'hour'), name='unique group activity'),
+        ),
+        migrations.RunPython(fill_group_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import posts.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0020_group_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileCapture',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='дата снятия')),
+                ('path', models.TextField(verbose_name='адрес')),
+                ('view', models.CharField(max_length=200, verbose_name='представление')),
+                ('duration_ms', models.FloatField(verbose_name='время ответа, мс')),
+                ('samples', models.PositiveIntegerField(verbose_name='число сэмплов')),
+                ('queries', models.PositiveIntegerField(verbose_name='число SQL-запросов')),
+                ('stacks', models.FileField(storage=posts.models.PrivateStorage(), upload_to='', verbose_name='стеки')),
+                ('sql_timeline', models.FileField(storage=posts.models.PrivateStorage(), upload_to='', verbose_name='SQL по времени')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profile_captures', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+    ]
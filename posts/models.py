@@ -1,4 +1,10 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.db.models import Case, F, Max, Subquery, Value, When
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -21,6 +27,20 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    # Поля, которые выводит карточка поста posts/post_item.html
+    FEED_FIELDS = (
+        'id', 'text', 'pub_date', 'image', 'comment_count', 'version',
+        'author', 'author__username',
+        'group', 'group__slug', 'group__title',
+    )
+
+    def for_feed(self):
+        """Посты для карточек ленты: автор и группа одним JOIN."""
+        return self.select_related('author', 'group').only(
+            *self.FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         'текст поста',
@@ -40,10 +60,55 @@ class Post(models.Model):
     image = models.ImageField(
         upload_to='posts/',
         verbose_name='картинка поста', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(
+        'число комментариев', default=0, editable=False)
+    # Растёт при любом изменении того, что показывает карточка поста
+    version = models.PositiveIntegerField(
+        'версия карточки', default=1, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(fields=['pub_date', 'id'],
+                         name='post_pub_date_id_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Группа на момент загрузки: по ней сигналы переносят GroupStats
+        if 'group_id' in instance.__dict__:
+            instance.loaded_group_id = instance.group_id
+        return instance
+
+    def save(self, *args, **kwargs):
+        bumped = not self._state.adding and not kwargs.get('force_insert')
+        if bumped:
+            # Версию сдвигает база: два параллельных сохранения не получат
+            # один и тот же номер
+            self.version = models.F('version') + 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                # comment_count ведут сигналы комментариев через F(): полное
+                # сохранение устаревшего экземпляра не должно его затирать
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name != 'comment_count']
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        if bumped:
+            self.refresh_from_db(fields=['version'])
+
 
 class Comment(models.Model):
     author = models.ForeignKey(User,
@@ -58,6 +123,13 @@ class Comment(models.Model):
     created = models.DateTimeField('created',
                                    auto_now_add=True)
 
+    class Meta:
+        ordering = ('created', 'id')
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User,
@@ -66,9 +138,244 @@ class Follow(models.Model):
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='following')
+    # pub_date последнего поста автора, подтянутого в ленту подписчика
+    # при чтении (для авторов, чьи посты не рассылаются при записи)
+    timeline_synced = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique follow')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class AuthorStatsQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Счётчики автора; при первом обращении считаются по таблицам."""
+        try:
+            return self.get(user=user)
+        except self.model.DoesNotExist:
+            stats, created = self.get_or_create(user=user, defaults={
+                'posts_count': Post.objects.filter(author=user).count(),
+                'followers_count': Follow.objects.filter(author=user).count(),
+                'following_count': Follow.objects.filter(user=user).count(),
+            })
+            return stats
+
+    def bump(self, user_id, **deltas):
+        """Атомарно сдвигает счётчики уже созданной строки."""
+        self.filter(user_id=user_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()})
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats')
+    posts_count = models.PositiveIntegerField('число записей', default=0)
+    followers_count = models.PositiveIntegerField(
+        'число подписчиков', default=0)
+    following_count = models.PositiveIntegerField('число подписок', default=0)
+
+    objects = AuthorStatsQuerySet.as_manager()
+
+    def __str__(self):
+        return f'Статистика {self.user_id}'
+
+
+class GroupStatsQuerySet(models.QuerySet):
+    def for_group(self, group):
+        """Счётчики группы; при первом обращении считаются по таблице."""
+        try:
+            return self.get(group=group)
+        except self.model.DoesNotExist:
+            posts = Post.objects.filter(group=group)
+            stats, created = self.get_or_create(group=group, defaults={
+                'posts_count': posts.count(),
+                'last_post_at': posts.aggregate(
+                    last=Max('pub_date'))['last'],
+            })
+            return stats
+
+    def create_empty(self, group_ids):
+        """Пустые строки счётчиков для новых групп.
+
+        Каталог групп читает только GroupStats, поэтому строка нужна и
+        группе без постов. Уже созданные строки не трогаются.
+        """
+        self.bulk_create((self.model(group_id=group_id)
+                          for group_id in group_ids), ignore_conflicts=True)
+
+    def add_post(self, group_id, pub_date):
+        """Учитывает пост в уже созданной строке группы."""
+        self.filter(group_id=group_id).update(
+            posts_count=F('posts_count') + 1,
+            last_post_at=Case(
+                When(last_post_at__gte=pub_date, then=F('last_post_at')),
+                default=Value(pub_date)),
+        )
+
+    def remove_post(self, group_id):
+        """Убирает пост из счётчиков группы.
+
+        Последняя активность пересчитывается одним поиском по индексу
+        (group, pub_date).
+        """
+        self.filter(group_id=group_id).update(
+            posts_count=F('posts_count') - 1,
+            last_post_at=Subquery(
+                Post.objects.filter(group_id=group_id).order_by(
+                    '-pub_date').values('pub_date')[:1]),
+        )
+
+    def bump(self, group_id, **deltas):
+        """Атомарно сдвигает счётчики уже созданной строки.
+
+        Счётчики не уходят ниже нуля: пост мог выпасть из окна при
+        пересчёте раньше, чем его удалили.
+        """
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if deltas:
+            self.filter(group_id=group_id).update(**{
+                field: Greatest(F(field) + delta, 0)
+                for field, delta in deltas.items()})
+
+    def for_directory(self):
+        """Группы по убыванию активности, в порядке индекса."""
+        return self.select_related('group').order_by(
+            '-posts_24h', '-posts_7d', '-posts_count', '-authors_count',
+            'group')
+
+
+class GroupStats(models.Model):
+    group = models.OneToOneField(Group,
+                                 on_delete=models.CASCADE,
+                                 primary_key=True,
+                                 related_name='stats')
+    posts_count = models.PositiveIntegerField('число записей', default=0)
+    last_post_at = models.DateTimeField(
+        'последняя запись', blank=True, null=True)
+    # Окна активности пересчитывает команда compact_group_activity
+    posts_24h = models.PositiveIntegerField('записей за сутки', default=0)
+    posts_7d = models.PositiveIntegerField('записей за неделю', default=0)
+    authors_count = models.PositiveIntegerField('число авторов', default=0)
+
+    objects = GroupStatsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-posts_24h', '-posts_7d', '-posts_count',
+                                 '-authors_count', 'group'],
+                         name='groupstats_activity_idx'),
+        ]
+
+    def __str__(self):
+        return f'Статистика группы {self.group_id}'
+
+
+class GroupActivity(models.Model):
+    """Число постов автора в группе за час.
+
+    hour — номер часа от начала эпохи; часы старше недели сворачиваются
+    в строку с hour=0.
+    """
+    group = models.ForeignKey(Group,
+                              on_delete=models.CASCADE,
+                              related_name='+')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    hour = models.PositiveIntegerField()
+    posts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['group', 'author', 'hour'],
+                name='unique group activity')
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='groupactivity_hour_idx'),
+        ]
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Записи ленты с постами, готовыми для карточек."""
+        return self.select_related('post__author', 'post__group').only(
+            'pub_date', 'post',
+            *(f'post__{field}' for field in PostQuerySet.FEED_FIELDS))
+
+
+class TimelineEntry(models.Model):
+    """Пост автора в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    # Копия post.pub_date: лента читается одним диапазоном по индексу
+    pub_date = models.DateTimeField()
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique timeline entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+
+class PrivateStorage(FileSystemStorage):
+    """Файлы в PROFILING_ROOT: у них нет URL, отдаёт их только админка."""
+
+    @property
+    def base_location(self):
+        return str(settings.PROFILING_ROOT)
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Файл доступен только через админку')
+
+
+class ProfileCapture(models.Model):
+    """Профиль одного запроса: сэмплы стеков и SQL по времени."""
+    created = models.DateTimeField('дата снятия', auto_now_add=True,
+                                   db_index=True)
+    path = models.TextField('адрес')
+    view = models.CharField('представление', max_length=200)
+    user = models.ForeignKey(User,
+                             on_delete=models.SET_NULL,
+                             blank=True, null=True,
+                             related_name='profile_captures')
+    duration_ms = models.FloatField('время ответа, мс')
+    samples = models.PositiveIntegerField('число сэмплов')
+    queries = models.PositiveIntegerField('число SQL-запросов')
+    # Формат collapsed stacks: «кадр;кадр;кадр число» на строку
+    stacks = models.FileField('стеки', storage=PrivateStorage())
+    sql_timeline = models.FileField('SQL по времени',
+                                    storage=PrivateStorage())
+
+    class Meta:
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.view} {self.created:%Y-%m-%d %H:%M:%S}'
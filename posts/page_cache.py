@@ -0,0 +1,108 @@
+"""Кеш целых страниц для анонимных читателей.
+
+AnonymousPageCacheMiddleware стоит в MIDDLEWARE сразу после
+SecurityMiddleware и отдаёт сохранённую страницу раньше сессий,
+аутентификации и CSRF. Анонимным считается GET без cookie сессии.
+
+Сохраняются только ответы представлений с декоратором
+cache_for_anonymous. Он перечисляет теги страницы и до отрисовки
+запоминает их версии; запись поста, комментария или подписки сдвигает
+версию тега через invalidate, и страницы с этим тегом перестают
+отдаваться. Ответы, которые ставят cookie (например, csrftoken) или
+зависят не только от Cookie, в кеш не попадают.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+PAGE_TIMEOUT = 60 * 10
+PAGE_KEY = 'page:{}'
+TAG_KEY = 'page:tag:{}'
+
+
+def is_anonymous_get(request):
+    return (request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES)
+
+
+def page_key(request):
+    url = request.build_absolute_uri()
+    return PAGE_KEY.format(hashlib.md5(url.encode()).hexdigest())
+
+
+def tag_versions(tags):
+    keys = {TAG_KEY.format(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        # После вытеснения ключа не возвращаемся к старым номерам
+        cache.add(key, int(time.time() * 1000), None)
+        versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def tag_version(tag):
+    return tag_versions([tag])[tag]
+
+
+def invalidate(*tags):
+    for tag in tags:
+        try:
+            cache.incr(TAG_KEY.format(tag))
+        except ValueError:
+            tag_versions([tag])
+
+
+def cache_for_anonymous(*tags):
+    """Разрешает кешировать страницу для анонимов с тегами tags.
+
+    Теги — шаблоны str.format от аргументов URL, например
+    'author:{username}'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            versions = None
+            if is_anonymous_get(request):
+                versions = tag_versions(tag.format(**kwargs) for tag in tags)
+            response = view(request, *args, **kwargs)
+            if versions is not None:
+                response.page_cache_versions = versions
+            return response
+        return wrapper
+    return decorator
+
+
+def is_cacheable(response):
+    if response.status_code != 200 or response.cookies:
+        return False
+    if 'private' in response.get('Cache-Control', ''):
+        return False
+    vary = {header.strip().lower()
+            for header in response.get('Vary', '').split(',') if header}
+    return vary <= {'cookie'}
+
+
+class AnonymousPageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_anonymous_get(request):
+            return self.get_response(request)
+        key = page_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            versions, response = entry
+            if tag_versions(versions) == versions:
+                return get_conditional_response(
+                    request, etag=response.get('ETag'), response=response)
+        response = self.get_response(request)
+        versions = getattr(response, 'page_cache_versions', None)
+        if versions is not None and is_cacheable(response):
+            patch_vary_headers(response, ['Cookie'])
+            cache.set(key, (versions, response), PAGE_TIMEOUT)
+        return response
@@ -0,0 +1,106 @@
+import collections.abc
+import datetime
+
+from django.core.paginator import Paginator
+from django.utils import timezone
+
+POSTS_PER_PAGE = 10
+
+
+def encode_cursor(item, id_field='id', date_field='pub_date'):
+    """Курсор записи: микросекунды даты и id через дефис."""
+    delta = getattr(item, date_field) - datetime.datetime(
+        1970, 1, 1, tzinfo=timezone.utc)
+    micros = (delta.days * 86400 + delta.seconds) * 10 ** 6
+    return f'{micros + delta.microseconds}-{getattr(item, id_field)}'
+
+
+def decode_cursor(value):
+    """Возвращает (дату, id) или None, если курсор испорчен."""
+    try:
+        micros, post_id = (int(part) for part in value.split('-'))
+        pub_date = datetime.datetime(
+            1970, 1, 1, tzinfo=timezone.utc
+        ) + datetime.timedelta(microseconds=micros)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+    return pub_date, post_id
+
+
+class CursorPage(collections.abc.Sequence):
+    """Страница ленты, выбранная по ключу (pub_date, id) без OFFSET.
+
+    В отличие от django.core.paginator.Page не знает общего числа
+    записей, поэтому paginator у неё отсутствует.
+    """
+    paginator = None
+
+    def __init__(self, object_list, has_previous, has_next, id_field='id',
+                 date_field='pub_date'):
+        self.object_list = object_list
+        self._has_previous = has_previous
+        self._has_next = has_next
+        # QuerySet вычисляется здесь один раз и дальше отдаёт кеш
+        items = list(object_list)
+        self.previous_cursor = encode_cursor(
+            items[0], id_field, date_field) if items else None
+        self.next_cursor = encode_cursor(
+            items[-1], id_field, date_field) if items else None
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} posts>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+def paginate(request, queryset, per_page=POSTS_PER_PAGE, count=None,
+             id_field='id'):
+    """Страница ленты постов для запроса.
+
+    ?before=<курсор> и ?after=<курсор> выбирают более старые и более
+    новые записи индексным диапазоном по (pub_date, id_field): граница
+    pub_date <= X задаёт диапазон, а exclude отсекает уже показанные
+    записи с той же датой. Без курсора и для старых ссылок ?page=N
+    работает обычный Paginator; если число записей уже известно,
+    count избавляет его от COUNT(*).
+    """
+    queryset = queryset.order_by('-pub_date', f'-{id_field}')
+    before = decode_cursor(request.GET.get('before'))
+    after = decode_cursor(request.GET.get('after'))
+    if before is not None:
+        pub_date, item_id = before
+        items = list(queryset.filter(pub_date__lte=pub_date).exclude(
+            pub_date=pub_date, **{f'{id_field}__gte': item_id}
+        )[:per_page + 1])
+        return CursorPage(
+            items[:per_page], True, len(items) > per_page, id_field)
+    if after is not None:
+        pub_date, item_id = after
+        newer = queryset.reverse().filter(pub_date__gte=pub_date)
+        items = list(newer.exclude(
+            pub_date=pub_date, **{f'{id_field}__lte': item_id}
+        )[:per_page + 1])
+        if items:
+            has_previous = len(items) > per_page
+            return CursorPage(
+                items[:per_page][::-1], has_previous, True, id_field)
+    paginator = Paginator(queryset, per_page)
+    if count is not None:
+        paginator.count = count
+    page = paginator.get_page(request.GET.get('page'))
+    page.previous_cursor = encode_cursor(page[0], id_field) if page else None
+    page.next_cursor = encode_cursor(page[-1], id_field) if page else None
+    return page
@@ -0,0 +1,131 @@
+"""Профилирование отдельного запроса по требованию.
+
+Запрос с заголовком X-Profile профилируется, если его прислал сотрудник
+(is_staff) или значение заголовка — подписанный токен из команды
+profiling_token. Пока работает представление, поток Sampler раз в
+PROFILING_INTERVAL секунд снимает стек потока запроса, а execute_wrapper
+записывает SQL по времени. Результат сохраняется в ProfileCapture:
+стеки в формате collapsed (speedscope и flamegraph.pl читают его
+напрямую) и SQL в JSON; список снимков — в админке.
+
+Без заголовка middleware делает одну проверку словаря META.
+"""
+import collections
+import json
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.utils import timezone
+
+from . import metrics
+from .models import ProfileCapture
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+TOKEN_SALT = 'posts.profiling'
+
+
+def make_token():
+    return signing.dumps('profile', salt=TOKEN_SALT)
+
+
+def is_allowed(request):
+    try:
+        signing.loads(request.META[PROFILE_HEADER], salt=TOKEN_SALT,
+                      max_age=settings.PROFILING_TOKEN_MAX_AGE)
+        return True
+    except signing.BadSignature:
+        return request.user.is_staff
+
+
+def frame_name(code):
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """Поток, который снимает стек другого потока с интервалом."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+class SqlTimeline:
+    """execute_wrapper: SQL со смещением от начала запроса."""
+
+    def __init__(self, start):
+        self.start = start
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'start_ms': (started - self.start) * 1000,
+                'duration_ms': (time.perf_counter() - started) * 1000,
+                'sql': sql,
+            })
+
+
+def profile(request, get_response):
+    start = time.perf_counter()
+    sampler = Sampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+    timeline = SqlTimeline(start)
+    sampler.start()
+    try:
+        with connection.execute_wrapper(timeline):
+            response = get_response(request)
+    finally:
+        sampler.stop()
+    duration_ms = (time.perf_counter() - start) * 1000
+    name = f'{timezone.now():%Y%m%d-%H%M%S}-{metrics.view_name(request)}'
+    capture = ProfileCapture(
+        path=request.get_full_path(), view=metrics.view_name(request),
+        user=request.user if request.user.is_authenticated else None,
+        duration_ms=duration_ms, samples=sum(sampler.stacks.values()),
+        queries=len(timeline.queries))
+    capture.stacks.save(f'{name}.folded', ContentFile(''.join(
+        f'{stack} {count}\n' for stack, count in sampler.stacks.items())),
+        save=False)
+    capture.sql_timeline.save(f'{name}.sql.json', ContentFile(
+        json.dumps(timeline.queries, ensure_ascii=False)), save=False)
+    capture.save()
+    response['X-Profile-Capture'] = str(capture.pk)
+    return response
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_HEADER in request.META and is_allowed(request):
+            return profile(request, self.get_response)
+        return self.get_response(request)
@@ -0,0 +1,63 @@
+"""Плагин pytest: бюджет SQL-запросов на тест.
+
+Бюджет задаётся маркером @pytest.mark.query_budget(10) или для всех
+тестов опцией --query-budget=N. Считаются запросы тела теста без
+фикстур; тест сверх бюджета падает со списком повторяющихся форм SQL
+и мест, откуда они пришли.
+"""
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--query-budget', type=int, default=None,
+        help='Сколько SQL-запросов может сделать тест без своего маркера')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'query_budget(limit): не больше limit SQL-запросов')
+
+
+def query_budget(item):
+    marker = item.get_closest_marker('query_budget')
+    if marker is not None:
+        return marker.args[0]
+    return item.config.getoption('query_budget')
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    limit = query_budget(item)
+    if limit is None:
+        yield
+        return
+    from django.db import connection
+
+    from posts.queries import QueryLog
+
+    item.query_log = QueryLog()
+    with connection.execute_wrapper(item.query_log):
+        yield
+
+
+def budget_report(log, limit):
+    lines = [f'SQL-запросов: {log.count}, бюджет: {limit}']
+    for group in log.repeated(2):
+        where = ', '.join(filter(None, (group['template'], group['frame'])))
+        lines.append(f"  {group['count']} x {group['sql']}")
+        lines.append(f'      из {where or "?"}')
+    return '\n'.join(lines)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    log = getattr(item, 'query_log', None)
+    if call.when != 'call' or not report.passed or log is None:
+        return
+    limit = query_budget(item)
+    if log.count > limit:
+        report.outcome = 'failed'
+        report.longrepr = budget_report(log, limit)
@@ -0,0 +1,141 @@
+"""Поиск N+1 и медленных SQL-запросов.
+
+QueryLog — execute_wrapper, который группирует запросы по форме SQL:
+литералы и списки IN заменены заглушками, так что «один запрос на
+карточку» складывается в одну группу. Для группы запоминается место,
+откуда пришёл первый запрос: кадр кода проекта и строка шаблона.
+
+QueryInspectorMiddleware включает QueryLog в разработке (DEBUG) для
+каждого запроса, а в продакшене — для доли
+QUERY_INSPECTOR_SAMPLE_RATE. Группы из QUERY_INSPECTOR_REPEAT_THRESHOLD
+запросов и больше и запросы дольше QUERY_INSPECTOR_SLOW_MS (с EXPLAIN
+QUERY PLAN) пишутся в логгер posts.queries по одной JSON-строке.
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics, page_cache
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+TEMPLATE_RENDER = 'render_annotated'
+# Обёртки и сквозные middleware — не источник запроса
+INSTRUMENTATION = {__file__, metrics.__file__, page_cache.__file__}
+
+
+def shape(sql):
+    """Форма запроса: SQL без литералов и с IN (...) любой длины."""
+    return LITERAL.sub('?', IN_LIST.sub('IN (...)', sql))
+
+
+def caller():
+    """Кадр кода проекта и строка шаблона, из-за которых ушёл запрос."""
+    location = {'frame': None, 'template': None}
+    frame = sys._getframe(1)
+    while frame is not None and None in location.values():
+        code = frame.f_code
+        if location['template'] is None and code.co_name == TEMPLATE_RENDER:
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None:
+                location['template'] = '{}:{}'.format(
+                    node.origin.template_name, token.lineno)
+        if location['frame'] is None and is_project_file(code.co_filename):
+            location['frame'] = '{}:{} in {}'.format(
+                os.path.relpath(code.co_filename, settings.BASE_DIR),
+                frame.f_lineno, code.co_name)
+        frame = frame.f_back
+    return location
+
+
+def is_project_file(filename):
+    return (filename.startswith(str(settings.BASE_DIR))
+            and 'site-packages' not in filename
+            and filename not in INSTRUMENTATION)
+
+
+class QueryLog:
+    """execute_wrapper, группирующий запросы по форме SQL."""
+
+    def __init__(self, slow_ms=None):
+        self.slow_ms = slow_ms
+        self.groups = {}
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            key = shape(sql)
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = {
+                    'sql': key, 'count': 0, 'time_ms': 0.0, **caller()}
+            group['count'] += 1
+            group['time_ms'] += elapsed
+            if self.slow_ms is not None and elapsed >= self.slow_ms:
+                self.slow.append({'sql': sql, 'params': params,
+                                  'many': many, 'time_ms': elapsed,
+                                  **caller()})
+
+    @property
+    def count(self):
+        return sum(group['count'] for group in self.groups.values())
+
+    def repeated(self, threshold):
+        """Группы из threshold запросов и больше, самые частые первыми."""
+        return sorted(
+            (group for group in self.groups.values()
+             if group['count'] >= threshold),
+            key=lambda group: -group['count'])
+
+
+def explain(sql, params):
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [' '.join(map(str, row)) for row in cursor.fetchall()]
+
+
+def report(request, log):
+    """JSON-строки о повторах и медленных запросах одного запроса."""
+    context = {'view': metrics.view_name(request), 'path': request.path}
+    for group in log.repeated(settings.QUERY_INSPECTOR_REPEAT_THRESHOLD):
+        yield {'event': 'repeated_query', **context, **group}
+    for query in log.slow:
+        plan = None
+        if not query['many'] and query['sql'].lstrip().upper().startswith(
+                'SELECT'):
+            plan = explain(query['sql'], query['params'])
+        yield {'event': 'slow_query', **context, **query, 'plan': plan}
+
+
+class QueryInspectorMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (settings.DEBUG
+                or random.random() < settings.QUERY_INSPECTOR_SAMPLE_RATE):
+            return self.get_response(request)
+        log = QueryLog(slow_ms=settings.QUERY_INSPECTOR_SLOW_MS)
+        with connection.execute_wrapper(log):
+            response = self.get_response(request)
+        for record in report(request, log):
+            logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        return response
@@ -0,0 +1,128 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс posts_post_fts хранит только токены текста (content='posts_post')
+и обновляется триггерами на posts_post, поэтому его не обходят ни
+QuerySet.update, ни удаление каскадом. SQLite при перестройке таблицы
+в миграциях удаляет её триггеры: команда rebuild_search_index создаёт
+их заново и переиндексирует посты.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .pagination import POSTS_PER_PAGE
+
+FTS_TABLE = 'posts_post_fts'
+INDEXED_TEXT = "replace(replace({}.text, 'ё', 'е'), 'Ё', 'Е')"
+TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert AFTER INSERT "
+    "ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(rowid, text) "
+    f"VALUES (new.id, {INDEXED_TEXT.format('new')}); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete AFTER DELETE "
+    "ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    f"VALUES ('delete', old.id, {INDEXED_TEXT.format('old')}); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_update AFTER UPDATE OF text "
+    "ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    f"VALUES ('delete', old.id, {INDEXED_TEXT.format('old')}); "
+    "INSERT INTO posts_post_fts(rowid, text) "
+    f"VALUES (new.id, {INDEXED_TEXT.format('new')}); END",
+)
+
+
+def drop_triggers():
+    """Снимает триггеры индекса на время массовой загрузки постов.
+
+    Вернуть их и проиндексировать посты — команда rebuild_search_index.
+    """
+    with connection.cursor() as cursor:
+        for action in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{action}')
+
+
+def normalize(text):
+    """Текст в том виде, в каком он попадает в индекс."""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def match_expression(query):
+    """Запрос FTS5 из слов пользователя: все слова, каждое как префикс.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 (OR, NEAR, *, ^)
+    из пользовательского ввода не интерпретируются.
+    """
+    words = re.findall(r'\w+', normalize(query))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def matching(queryset, query):
+    """Фильтрует QuerySet постов по индексу; для поиска в админке."""
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,)))
+
+
+def decode_cursor(value):
+    """Возвращает (rank, id) или None, если курсор испорчен."""
+    try:
+        rank, post_id = value.rsplit('_', 1)
+        return float(rank), int(post_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+class SearchPage:
+    """Страница результатов, упорядоченных по bm25, без OFFSET."""
+
+    def __init__(self, object_list, has_next, next_cursor):
+        self.object_list = object_list
+        self._has_next = has_next
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+
+def search_page(query, cursor=None, per_page=POSTS_PER_PAGE):
+    """Посты по релевантности; cursor — «rank_id» последнего показанного.
+
+    Более релевантные записи идут первыми, при равном rank — новые.
+    """
+    match = match_expression(query)
+    if not match:
+        return SearchPage([], False, None)
+    sql = (f'SELECT rowid, rank FROM {FTS_TABLE} '
+           f'WHERE {FTS_TABLE} MATCH %s')
+    params = [match]
+    after = decode_cursor(cursor)
+    if after is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid < %s))'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY rank, rowid DESC LIMIT %s'
+    params.append(per_page + 1)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        hits = db_cursor.fetchall()
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+    posts = Post.objects.for_feed().in_bulk([post_id for post_id, _ in hits])
+    # Пост мог быть удалён между запросами
+    object_list = [posts[post_id] for post_id, _ in hits if post_id in posts]
+    next_cursor = f'{hits[-1][1]!r}_{hits[-1][0]}' if has_next else None
+    return SearchPage(object_list, has_next, next_cursor)
@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import activity, cards, feed_cache, groups, page_cache, timeline
+from .models import AuthorStats, Comment, Follow, Group, GroupStats, Post
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_feed_cache(sender, instance, **kwargs):
+    # Перенесённый пост пропадает и со страницы прежней группы
+    group_ids = {instance.group_id,
+                 getattr(instance, 'loaded_group_id', None)} - {None}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True) if group_ids else ()
+    feed_cache.forget(usernames=[instance.author.username], slugs=slugs,
+                      post_ids=[instance.id])
+
+
+@receiver(post_delete, sender=Post)
+def forget_card(sender, instance, **kwargs):
+    cards.forget(instance)
+
+
+def bump_card_versions(posts, **counters):
+    """Сдвигает версии карточек вместе с денормализованными счётчиками."""
+    posts.update(version=F('version') + 1, **counters)
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    # Имя на момент загрузки: по нему видно, что автора переименовали
+    if 'username' in instance.__dict__:
+        instance.loaded_username = instance.username
+
+
+@receiver(post_save, sender=User)
+def rename_author_cards(sender, instance, created, **kwargs):
+    previous = getattr(instance, 'loaded_username', None)
+    instance.loaded_username = instance.username
+    # Вход, смена пароля и прочие правки карточки автора не меняют
+    if created or previous == instance.username:
+        return
+    bump_card_versions(Post.objects.filter(author=instance))
+    # Страницы постов помечены тегом автора, отдельные post: не нужны
+    feed_cache.forget(
+        usernames=[previous, instance.username],
+        slugs=Group.objects.filter(posts__author=instance).values_list(
+            'slug', flat=True).distinct())
+    page_cache.invalidate('authors')
+
+
+@receiver(post_save, sender=Group)
+def rename_group_cards(sender, instance, created, **kwargs):
+    if not created:
+        bump_card_versions(Post.objects.filter(group=instance))
+        feed_cache.forget(
+            usernames=User.objects.filter(posts__group=instance)
+            .values_list('username', flat=True).distinct(),
+            slugs=[instance.slug])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_groups(sender, instance, **kwargs):
+    groups.forget()
+    page_cache.invalidate(f'group:{instance.slug}', 'groups')
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.create_empty([instance.id])
+
+
+@receiver(post_save, sender=Post)
+def increment_posts_count(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, posts_count=1)
+        feed_cache.adjust_post_count(1)
+        timeline.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def decrement_posts_count(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, posts_count=-1)
+    feed_cache.adjust_post_count(-1)
+
+
+@receiver(post_save, sender=Post)
+def move_group_stats(sender, instance, created, **kwargs):
+    previous = None if created else getattr(
+        instance, 'loaded_group_id', instance.group_id)
+    if previous == instance.group_id:
+        return
+    if previous is not None:
+        GroupStats.objects.remove_post(previous)
+        activity.remove_post(previous, instance.author_id, instance.pub_date)
+    if instance.group_id is not None:
+        GroupStats.objects.add_post(instance.group_id, instance.pub_date)
+        activity.add_post(
+            instance.group_id, instance.author_id, instance.pub_date)
+    instance.loaded_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def decrement_group_stats(sender, instance, **kwargs):
+    if instance.group_id is not None:
+        GroupStats.objects.remove_post(instance.group_id)
+        activity.remove_post(
+            instance.group_id, instance.author_id, instance.pub_date)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created:
+        posts = Post.objects.filter(pk=instance.post_id)
+        bump_card_versions(posts, comment_count=F('comment_count') + 1)
+        feed_cache.forget_posts(posts)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    # Удаление из админки и каскадное удаление тоже проходят здесь
+    posts = Post.objects.filter(pk=instance.post_id)
+    bump_card_versions(posts, comment_count=F('comment_count') - 1)
+    feed_cache.forget_posts(posts)
+
+
+@receiver(post_save, sender=Follow)
+def fill_timeline(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, followers_count=1)
+        AuthorStats.objects.bump(instance.user_id, following_count=1)
+        timeline.pull(instance)
+        forget_follow_pages(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, followers_count=-1)
+    AuthorStats.objects.bump(instance.user_id, following_count=-1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.settle(instance.author_id)
+    forget_follow_pages(instance)
+
+
+def forget_follow_pages(follow):
+    # Счётчики подписок видны на страницах обоих пользователей
+    page_cache.invalidate(f'author:{follow.author.username}',
+                          f'author:{follow.user.username}')
@@ -0,0 +1,184 @@
+"""Карта сайта: индекс /sitemap.xml и шарды по SHARD_SIZE адресов.
+
+Шард — диапазон первичного ключа раздела, поэтому его состав не
+зависит от соседних шардов. Строки читаются пачками по ключу (keyset)
+и сразу уходят в StreamingHttpResponse: память не растёт с таблицей.
+
+Готовый шард кешируется по отпечатку его диапазона: числу строк и
+датам, а для постов ещё сумме Post.version, которую сдвигают правки и
+переименование автора. Переименования авторов и правки групп в
+агрегаты не попадают и сдвигают теги 'authors' и 'groups' из
+page_cache. Запрос к неизменному шарду стоит одного агрегата.
+"""
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Exists, Max, Min, OuterRef, Sum
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+
+from . import page_cache
+from .models import Group, Post
+
+User = get_user_model()
+
+SHARD_SIZE = 50000
+CHUNK_SIZE = 2000
+SITEMAP_TIMEOUT = 60 * 60 * 24
+CONTENT_TYPE = 'application/xml'
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+class Section:
+    """Раздел карты сайта, нарезанный на шарды по первичному ключу."""
+    tag = None
+
+    def queryset(self):
+        raise NotImplementedError
+
+    def aggregates(self):
+        return {'count': Count('pk')}
+
+    def location(self, obj):
+        raise NotImplementedError
+
+    def lastmod(self, obj):
+        return None
+
+    def shard_count(self):
+        last = self.queryset().aggregate(last=Max('pk'))['last'] or 0
+        return -(-last // SHARD_SIZE)
+
+    def shard(self, number):
+        start = number * SHARD_SIZE
+        return self.queryset().filter(
+            pk__gt=start, pk__lte=start + SHARD_SIZE)
+
+    def fingerprint(self, number):
+        """Число строк шарда и отпечаток его содержимого."""
+        values = self.shard(number).order_by().aggregate(**self.aggregates())
+        if self.tag is not None:
+            values['tag'] = page_cache.tag_version(self.tag)
+        seed = repr(sorted(values.items()))
+        return values['count'], hashlib.md5(seed.encode()).hexdigest()
+
+    def rows(self, number):
+        """Строки шарда пачками по CHUNK_SIZE по возрастанию ключа."""
+        shard = self.shard(number).order_by('pk')
+        chunk = list(shard[:CHUNK_SIZE])
+        while chunk:
+            yield chunk
+            if len(chunk) < CHUNK_SIZE:
+                return
+            chunk = list(shard.filter(pk__gt=chunk[-1].pk)[:CHUNK_SIZE])
+
+
+class PostSection(Section):
+    def queryset(self):
+        return Post.objects.select_related('author').only(
+            'id', 'pub_date', 'author__username')
+
+    def aggregates(self):
+        return {'count': Count('pk'), 'first': Min('pub_date'),
+                'last': Max('pub_date'), 'versions': Sum('version')}
+
+    def location(self, post):
+        return reverse('post', kwargs={'username': post.author.username,
+                                       'post_id': post.id})
+
+    def lastmod(self, post):
+        return post.pub_date
+
+
+class AuthorSection(Section):
+    tag = 'authors'
+
+    def queryset(self):
+        return User.objects.annotate(has_posts=Exists(
+            Post.objects.filter(author=OuterRef('pk')))).filter(
+            has_posts=True).only('id', 'username')
+
+    def location(self, user):
+        return reverse('profile', kwargs={'username': user.username})
+
+
+class GroupSection(Section):
+    tag = 'groups'
+
+    def queryset(self):
+        return Group.objects.select_related('stats').only(
+            'id', 'slug', 'stats__last_post_at')
+
+    def aggregates(self):
+        return {'count': Count('pk'), 'last': Max('stats__last_post_at')}
+
+    def location(self, group):
+        return reverse('group_detail', kwargs={'slug': group.slug})
+
+    def lastmod(self, group):
+        stats = getattr(group, 'stats', None)
+        return stats and stats.last_post_at
+
+
+SECTIONS = {
+    'posts': PostSection(),
+    'authors': AuthorSection(),
+    'groups': GroupSection(),
+}
+
+
+def url_entry(request, section, obj):
+    location = request.build_absolute_uri(section.location(obj))
+    entry = f'<url><loc>{escape(location)}</loc>'
+    lastmod = section.lastmod(obj)
+    if lastmod is not None:
+        entry += f'<lastmod>{lastmod.date().isoformat()}</lastmod>'
+    return entry + '</url>\n'
+
+
+def render_shard(request, section, number):
+    yield f'{XML_HEADER}<urlset xmlns="{XMLNS}">\n'
+    for chunk in section.rows(number):
+        yield ''.join(url_entry(request, section, obj) for obj in chunk)
+    yield '</urlset>\n'
+
+
+def cache_when_done(key, parts):
+    """Отдаёт части ответа и кладёт шард в кеш, когда он дописан."""
+    done = []
+    for part in parts:
+        done.append(part)
+        yield part
+    cache.set(key, ''.join(done), SITEMAP_TIMEOUT)
+
+
+def sitemap_index(request):
+    entries = [XML_HEADER, f'<sitemapindex xmlns="{XMLNS}">\n']
+    for name, section in SECTIONS.items():
+        for number in range(section.shard_count()):
+            location = request.build_absolute_uri(reverse(
+                'sitemap_section',
+                kwargs={'section': name, 'number': number}))
+            entries.append(
+                f'<sitemap><loc>{escape(location)}</loc></sitemap>\n')
+    entries.append('</sitemapindex>\n')
+    return HttpResponse(''.join(entries), content_type=CONTENT_TYPE)
+
+
+def sitemap_section(request, section, number):
+    sitemap = SECTIONS.get(section)
+    if sitemap is None:
+        raise Http404('Нет такого раздела карты сайта')
+    count, fingerprint = sitemap.fingerprint(number)
+    if not count and number >= sitemap.shard_count():
+        raise Http404('Нет такого шарда карты сайта')
+    key = f'sitemap:{section}:{number}:{fingerprint}'
+    content = cache.get(key)
+    if content is not None:
+        return HttpResponse(content, content_type=CONTENT_TYPE)
+    return StreamingHttpResponse(
+        cache_when_done(key, render_shard(request, sitemap, number)),
+        content_type=CONTENT_TYPE)
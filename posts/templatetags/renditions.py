@@ -0,0 +1,13 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_image(image):
+    """Готовые превью карточки или None, если они ещё создаются."""
+    if not image:
+        return None
+    return thumbnails.card_image(image)
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class AdminChangeListTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        for index in range(start, start + count):
+            author = User.objects.create_user(username=f'author{index}')
+            post = Post.objects.create(text=f'Запись {index}',
+                                       author=author, group=self.group)
+            Comment.objects.create(text='Комментарий', author=self.admin,
+                                   post=post)
+            Follow.objects.create(user=self.admin, author=author)
+
+    def changelist_queries(self, model, params=None):
+        url = reverse(f'admin:posts_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_query_count_does_not_depend_on_rows(self):
+        pages = (
+            ('post', None),
+            ('post', {'pub_date__year': '2020'}),
+            ('comment', None),
+            ('follow', None),
+        )
+        self.add_rows(2)
+        before = [len(self.changelist_queries(model, params))
+                  for model, params in pages]
+        self.add_rows(20)
+        after = [len(self.changelist_queries(model, params))
+                 for model, params in pages]
+        self.assertEqual(after, before)
+
+    def test_unfiltered_changelist_does_not_count_table(self):
+        self.add_rows(3)
+        for model in ('post', 'comment', 'follow'):
+            with self.subTest(model=model):
+                queries = self.changelist_queries(model)
+                self.assertFalse(any('COUNT(' in sql for sql in queries))
+
+    def test_filtered_count_is_limited(self):
+        self.add_rows(3)
+        queries = self.changelist_queries('post', {'pub_date__year': '2020'})
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT', counts[0])
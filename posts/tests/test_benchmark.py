@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count
+from django.test import TestCase, override_settings
+
+from .. import benchmark, timeline
+from ..models import AuthorStats, Follow, GroupStats, Post, TimelineEntry
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SeedBenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cache.clear()
+        call_command('seed_benchmark', posts=300, stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_counters_match_rows(self):
+        self.assertEqual(Post.objects.count(), 300)
+        for post in Post.objects.annotate(comments=Count('comment')):
+            self.assertEqual(post.comment_count, post.comments)
+        for stats in AuthorStats.objects.annotate(
+                posts=Count('user__posts', distinct=True),
+                followers=Count('user__following', distinct=True)):
+            self.assertEqual((stats.posts_count, stats.followers_count),
+                             (stats.posts, stats.followers))
+        for stats in GroupStats.objects.annotate(
+                posts=Count('group__posts')):
+            self.assertEqual(stats.posts_count, stats.posts)
+
+    def test_dataset_shape(self):
+        dates = list(Post.objects.values_list('pub_date', flat=True))
+        self.assertEqual(len(set(dates)), len(dates))
+        self.assertTrue(Post.objects.exclude(image='').exclude(
+            image=None).exists())
+        top = Post.objects.order_by('-comment_count').first()
+        self.assertGreaterEqual(top.comment_count, 100)
+        self.assertGreater(TimelineEntry.objects.count(), 0)
+        new_post = Post.objects.create(text='Запись', author=top.author)
+        self.assertEqual(new_post.id, 301)
+
+    def test_seed_needs_empty_database(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark', posts=10, stdout=StringIO())
+
+    def test_benchmark_flags_regressions(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        results = os.path.join(directory, 'results.json')
+        out = StringIO()
+        call_command('benchmark', requests=2, warmup=0, save=results,
+                     stdout=out)
+        with open(results) as file:
+            measured = json.load(file)
+        names = {'index', 'index_anonymous', 'group_posts', 'profile',
+                 'post_view', 'follow_index', 'new_post', 'add_comment'}
+        self.assertEqual(set(measured),
+                         names | {f'{name}:cold' for name in names})
+        # Пустой кеш: главная пересобирает страницу ленты из базы
+        self.assertGreater(measured['index_anonymous:cold']['queries'],
+                           measured['index_anonymous']['queries'])
+        self.assertEqual(Post.objects.count(), 300)
+        baseline = os.path.join(directory, 'baseline.json')
+        with open(baseline, 'w') as file:
+            json.dump({name: dict(result, queries=0)
+                       for name, result in measured.items()}, file)
+        with self.assertRaisesMessage(CommandError, 'index: SQL-запросов'):
+            call_command('benchmark', requests=2, warmup=0,
+                         only=['index'], baseline=baseline, stdout=out)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TIMELINE_FANOUT_LIMIT=5)
+class SeedTimelineFanoutTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cache.clear()
+        call_command('seed_benchmark', posts=300, stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_popular_authors_are_not_fanned_out(self):
+        follows = list(Follow.objects.filter(
+            author__stats__followers_count__gt=5).select_related('user'))
+        self.assertTrue(follows)
+        lagging = []
+        for follow in follows:
+            posts = Post.objects.filter(author_id=follow.author_id)
+            delivered = posts.filter(
+                pub_date__lte=follow.timeline_synced
+            ) if follow.timeline_synced else posts.none()
+            entries = TimelineEntry.objects.filter(
+                user_id=follow.user_id, author_id=follow.author_id)
+            self.assertEqual(
+                set(entries.values_list('post_id', flat=True)),
+                set(delivered.values_list('id', flat=True)))
+            if delivered.count() < posts.count():
+                lagging.append((follow, posts, entries))
+        self.assertTrue(lagging)
+        for follow, posts, entries in lagging:
+            timeline.catch_up(follow.user)
+            self.assertEqual(entries.count(), posts.count())
+
+
+class RegressionsTest(TestCase):
+    def test_only_worse_results_are_reported(self):
+        base = {'p95_ms': 10, 'peak_kib': 100, 'queries': 3}
+        results = {
+            'same': dict(base),
+            'slower': dict(base, p95_ms=13),
+            'noise': dict(base, p95_ms=11),
+            'more_queries': dict(base, queries=4),
+            'new': dict(base),
+        }
+        baseline = {name: base for name in results if name != 'new'}
+        problems = list(benchmark.regressions(results, baseline))
+        self.assertEqual(len(problems), 2)
+        self.assertTrue(problems[0].startswith('slower'))
+        self.assertTrue(problems[1].startswith('more_queries'))
@@ -0,0 +1,144 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import search
+from ..models import (AuthorStats, Comment, Follow, Group, GroupStats, Post,
+                      TimelineEntry)
+
+User = get_user_model()
+
+
+class BulkImportExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='leo')
+        self.reader = User.objects.create_user(username='anna')
+        self.group = Group.objects.create(
+            title='Путешествия', slug='travel', description='Заметки')
+        self.published = timezone.now() - datetime.timedelta(days=400)
+        for number in range(3):
+            post = Post.objects.create(
+                text=f'Крокодил номер {number}', author=self.author,
+                group=self.group if number else None)
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=self.published + datetime.timedelta(hours=number))
+        self.hot = Post.objects.order_by('id').last()
+        Comment.objects.create(post=self.hot, author=self.reader,
+                               text='Отлично')
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.for_user(self.author)
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def export(self):
+        call_command('export_jsonl', self.path, batch_size=2,
+                     stderr=StringIO())
+        with open(self.path, encoding='utf-8') as stream:
+            return [json.loads(line) for line in stream]
+
+    def load(self, **options):
+        call_command('import_jsonl', self.path, batch_size=2,
+                     stdout=StringIO(), **options)
+
+    def clear(self):
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        Group.objects.all().delete()
+
+    def test_export_writes_records_in_load_order(self):
+        records = self.export()
+        self.assertEqual([record['type'] for record in records],
+                         ['group', 'post', 'post', 'post', 'comment',
+                          'follow'])
+        post = records[3]
+        self.assertEqual(
+            (post['id'], post['author'], post['group'], post['pub_date']),
+            (self.hot.id, 'leo', 'travel',
+             (self.published + datetime.timedelta(hours=2)).isoformat()))
+        self.assertEqual(records[4]['post'], self.hot.id)
+        self.assertEqual(records[5], {'type': 'follow', 'user': 'anna',
+                                      'author': 'leo'})
+
+    def test_import_restores_rows_and_counters(self):
+        self.export()
+        self.clear()
+        self.load()
+        posts = list(Post.objects.order_by('pub_date'))
+        self.assertEqual(
+            [(post.text, post.pub_date, post.author_id) for post in posts],
+            [(f'Крокодил номер {number}',
+              self.published + datetime.timedelta(hours=number),
+              self.author.id) for number in range(3)])
+        group = Group.objects.get(slug='travel')
+        self.assertEqual(posts[-1].group, group)
+        self.assertEqual(posts[-1].comment_count, 1)
+        self.assertEqual(posts[-1].comment.get().author, self.reader)
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (3, 1))
+        group_stats = GroupStats.objects.get(group=group)
+        self.assertEqual(
+            (group_stats.posts_count, group_stats.last_post_at),
+            (2, posts[-1].pub_date))
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True)),
+            {post.id for post in posts})
+        self.assertEqual(Follow.objects.get().timeline_synced,
+                         posts[-1].pub_date)
+        created = Post.objects.create(text='Новая', author=self.author)
+        self.assertEqual(created.id, posts[-1].id + 1)
+
+    def test_import_creates_missing_users(self):
+        self.export()
+        self.clear()
+        User.objects.filter(username='anna').delete()
+        self.load()
+        reader = User.objects.get(username='anna')
+        self.assertFalse(reader.has_usable_password())
+        self.assertTrue(Follow.objects.filter(
+            user=reader, author=self.author).exists())
+
+    def test_deferred_indexes_are_rebuilt(self):
+        self.export()
+        self.clear()
+        self.load(defer_indexes=True)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Post._meta.db_table)
+        for index in Post._meta.indexes:
+            self.assertIn(index.name, constraints)
+        self.assertEqual(self.indexed('крокод'), set(
+            Post.objects.values_list('id', flat=True)))
+        post = Post.objects.create(text='Крокодил после', author=self.author)
+        self.assertEqual(self.indexed('после'), {post.id})
+
+    def indexed(self, word):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {search.FTS_TABLE} '
+                f'WHERE {search.FTS_TABLE} MATCH %s',
+                [search.match_expression(word)])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_broken_stream_loads_nothing(self):
+        records = self.export()
+        self.clear()
+        records[4]['post'] = 0
+        with open(self.path, 'w', encoding='utf-8') as stream:
+            stream.writelines(json.dumps(record) + '\n' for record in records)
+        with self.assertRaises(CommandError):
+            self.load()
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Group.objects.exists())
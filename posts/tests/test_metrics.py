@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import metrics
+from ..models import Post
+
+User = get_user_model()
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.author = User.objects.create_user(username='Tolstoy')
+        Post.objects.create(text='Запись', author=self.author)
+        self.metrics_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def samples(self):
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_requests_are_measured_per_view(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        samples = self.samples()
+        self.assertEqual(
+            samples['yatube_requests_total{view="index",status="200"}'], 2)
+        self.assertEqual(
+            samples['yatube_request_duration_seconds_count{view="index"}'],
+            2)
+        self.assertEqual(samples['yatube_request_duration_seconds_bucket'
+                                 '{view="index",le="+Inf"}'], 2)
+        self.assertGreater(samples['yatube_db_queries_total{view="index"}'],
+                           0)
+        self.assertGreater(
+            samples['yatube_response_bytes_total{view="index"}'], 0)
+        # Второй запрос анонима отдан из кеша страниц
+        self.assertGreater(samples['yatube_cache_hits_total{view="index"}'],
+                           0)
+        self.assertGreater(
+            samples['yatube_cache_misses_total{view="index"}'], 0)
+
+    def test_unknown_urls_share_one_label(self):
+        self.client.get('/no/such/page/at/all/')
+        self.assertIn('yatube_requests_total{view="unmatched",status="404"}',
+                      self.samples())
+
+    def test_worker_snapshots_are_summed(self):
+        with override_settings(METRICS_DIR=self.metrics_dir):
+            self.client.get(reverse('index'))
+            metrics.registry.flushed_at = (
+                time.monotonic() - metrics.FLUSH_INTERVAL)
+            self.client.get(reverse('index'))
+            own = os.path.join(self.metrics_dir, f'{os.getpid()}.json')
+            self.assertTrue(os.path.exists(own))
+            with open(own) as file:
+                snapshot = json.load(file)
+            with open(os.path.join(self.metrics_dir, '1.json'), 'w') as file:
+                json.dump(snapshot, file)
+            samples = self.samples()
+        # Свой процесс берётся из памяти, второй воркер — из файла
+        self.assertEqual(
+            samples['yatube_requests_total{view="index",status="200"}'], 4)
+
+    def test_metrics_are_closed_to_strangers(self):
+        url = reverse('metrics')
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(headers=headers):
+                self.assertEqual(
+                    self.client.get(url, **headers).status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(
+                url, HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class MeteredCacheTest(TestCase):
+    def test_any_backend_is_metered(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        for backend, location in (
+                ('django.core.cache.backends.locmem.LocMemCache', 'metered'),
+                ('django.core.cache.backends.filebased.FileBasedCache',
+                 directory)):
+            with self.subTest(backend=backend):
+                metered = metrics.MeteredCache(
+                    location, {'OPTIONS': {'BACKEND': backend}})
+                stats = metrics._local.stats = metrics.RequestStats()
+                try:
+                    metered.set('a', 1)
+                    self.assertEqual(metered.get('a'), 1)
+                    self.assertIsNone(metered.get('b'))
+                    self.assertEqual(metered.get_many(['a', 'b']), {'a': 1})
+                    self.assertEqual(metered.get_or_set('c', 3), 3)
+                    self.assertIn('c', metered)
+                finally:
+                    metrics._local.stats = None
+                self.assertEqual((stats.cache_hits, stats.cache_misses),
+                                 (2, 3))
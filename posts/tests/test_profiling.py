@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post, ProfileCapture
+from ..profiling import Sampler, make_token
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PROFILING_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROFILING_ROOT=PROFILING_ROOT)
+class ProfilingTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(PROFILING_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Tolstoy')
+        Post.objects.create(text='Запись', author=self.author)
+        self.staff = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+        self.url = reverse('profile', kwargs={'username': 'Tolstoy'})
+
+    def test_requests_without_permission_are_not_profiled(self):
+        user_client = Client()
+        user_client.force_login(self.author)
+        for client, headers in (
+                (self.client, {}),
+                (self.client, {'HTTP_X_PROFILE': 'forged'}),
+                (user_client, {'HTTP_X_PROFILE': '1'})):
+            response = client.get(self.url, **headers)
+            self.assertNotIn('X-Profile-Capture', response)
+        self.assertFalse(ProfileCapture.objects.exists())
+
+    def test_staff_request_is_captured(self):
+        response = self.staff_client.get(self.url, HTTP_X_PROFILE='1')
+        capture = ProfileCapture.objects.get(
+            pk=response['X-Profile-Capture'])
+        self.assertEqual(capture.view, 'profile')
+        self.assertEqual(capture.user, self.staff)
+        self.assertGreater(capture.queries, 0)
+        with capture.sql_timeline.open() as file:
+            timeline = json.load(file)
+        self.assertEqual(len(timeline), capture.queries)
+        self.assertTrue(all(query['sql'] for query in timeline))
+        self.assertTrue(capture.stacks.name.endswith('.folded'))
+
+    def test_signed_header_enables_profiling_for_anyone(self):
+        response = self.client.get(self.url, HTTP_X_PROFILE=make_token())
+        self.assertIn('X-Profile-Capture', response)
+        self.assertIsNone(ProfileCapture.objects.get().user)
+
+    def test_captures_are_listed_in_admin(self):
+        self.staff_client.get(self.url, HTTP_X_PROFILE='1')
+        response = self.staff_client.get(
+            reverse('admin:posts_profilecapture_changelist'))
+        self.assertContains(response, '/Tolstoy/')
+
+    def test_capture_files_are_private(self):
+        response = self.staff_client.get(self.url, HTTP_X_PROFILE='1')
+        capture = ProfileCapture.objects.get(
+            pk=response['X-Profile-Capture'])
+        self.assertTrue(capture.stacks.path.startswith(PROFILING_ROOT))
+        self.assertEqual(os.listdir(MEDIA_ROOT), [])
+        with self.assertRaises(ValueError):
+            capture.stacks.url
+        download = reverse('admin:posts_profilecapture_download',
+                           kwargs={'pk': capture.pk, 'field': 'sql_timeline'})
+        self.assertContains(self.staff_client.get(reverse(
+            'admin:posts_profilecapture_change', args=[capture.pk])),
+            download)
+        response = self.staff_client.get(download)
+        timeline = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(timeline), capture.queries)
+        user_client = Client()
+        user_client.force_login(self.author)
+        self.assertEqual(user_client.get(download).status_code, 302)
+        self.assertEqual(self.staff_client.get(reverse(
+            'admin:posts_profilecapture_download',
+            kwargs={'pk': capture.pk, 'field': 'path'})).status_code, 404)
+
+
+class SamplerTest(TestCase):
+    def test_sampler_collects_stacks_of_target_thread(self):
+        def slow_function():
+            time.sleep(0.05)
+
+        sampler = Sampler(threading.get_ident(), 0.001)
+        sampler.start()
+        slow_function()
+        sampler.stop()
+        self.assertGreater(sum(sampler.stacks.values()), 0)
+        stack = max(sampler.stacks, key=sampler.stacks.get)
+        self.assertIn('slow_function', stack.split(';')[-1])
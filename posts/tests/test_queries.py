@@ -0,0 +1,61 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post
+from ..queries import QueryLog, shape
+
+User = get_user_model()
+
+
+class QueryLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(3):
+            author = User.objects.create_user(username=f'author{index}')
+            Post.objects.create(text=f'Запись {index}', author=author)
+
+    def test_shape_hides_literals_and_in_lists(self):
+        self.assertEqual(
+            shape('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            shape('SELECT * FROM t WHERE id IN (%s) LIMIT 5'))
+
+    def test_repeated_queries_are_grouped_with_their_frame(self):
+        log = QueryLog()
+        with connection.execute_wrapper(log):
+            for post in Post.objects.all():
+                post.author.username
+        group, = log.repeated(3)
+        self.assertEqual(group['count'], 3)
+        self.assertIn('auth_user', group['sql'])
+        self.assertIn('test_queries.py', group['frame'])
+
+    def test_template_line_is_attributed(self):
+        template = Template('{% for post in posts %}\n'
+                            '{{ post.author.username }}\n'
+                            '{% endfor %}')
+        log = QueryLog()
+        with connection.execute_wrapper(log):
+            template.render(Context({'posts': Post.objects.all()}))
+        group, = log.repeated(3)
+        self.assertTrue(group['template'].endswith(':2'))
+
+    @override_settings(DEBUG=True, QUERY_INSPECTOR_REPEAT_THRESHOLD=1,
+                       QUERY_INSPECTOR_SLOW_MS=0)
+    def test_middleware_writes_json_lines(self):
+        with self.assertLogs('posts.queries', 'INFO') as logs:
+            self.client.get(reverse('index'))
+        records = [json.loads(line.split(':', 2)[2]) for line in logs.output]
+        events = {record['event'] for record in records}
+        self.assertEqual(events, {'repeated_query', 'slow_query'})
+        for record in records:
+            self.assertEqual(record['view'], 'index')
+        plans = [record['plan'] for record in records
+                 if record['event'] == 'slow_query'
+                 and record['sql'].startswith('SELECT')]
+        self.assertTrue(plans and all(plans))
@@ -1,13 +1,25 @@
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from ..models import Group, Post, Follow
+from .. import (activity, cards, feed_cache, feeds, page_cache, sitemaps,
+                thumbnails, views)
+from ..pagination import encode_cursor
+from ..models import (AuthorStats, Comment, Group, GroupActivity, GroupStats,
+                      Post, Follow, TimelineEntry)
 from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 import shutil
 import tempfile
 from django.core.cache import cache
+from django.core.management import call_command
+from io import StringIO
+from unittest import mock
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import datetime
+import threading
 
 
 User = get_user_model()
@@ -36,6 +48,71 @@ class PaginatorViewsTest(TestCase):
         response = self.client.get(reverse('index') + '?page=2')
         self.assertEqual(len(response.context.get('page').object_list), 3)
 
+    def test_index_pages_without_count_query(self):
+        cache.clear()
+        self.client.get(reverse('index'))
+        Post.objects.create(text='Ещё запись', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in queries))
+        self.assertEqual(response.context['page'].paginator.count, 14)
+
+
+class CursorPaginatorViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        for index in range(13):
+            Post.objects.create(
+                text=f'Эта запись № {index} создана для проверки теста',
+                author=self.user,
+                group=self.group,
+            )
+
+    def test_before_cursor_returns_older_posts(self):
+        urls = (
+            reverse('index'),
+            reverse('group_detail', kwargs={'slug': 'test-slug'}),
+            reverse('profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page']
+                response = self.client.get(
+                    f'{url}?before={first.next_cursor}')
+                page = response.context['page']
+                self.assertEqual(len(page), 3)
+                self.assertFalse(page.has_next())
+                self.assertTrue(page.has_previous())
+                self.assertFalse(set(page) & set(first))
+
+    def test_before_cursor_is_stable_after_new_post(self):
+        url = reverse('index')
+        first = self.client.get(url).context['page']
+        older = list(self.client.get(
+            f'{url}?before={first.next_cursor}').context['page'])
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.client.get(f'{url}?before={first.next_cursor}')
+        self.assertEqual(list(response.context['page']), older)
+
+    def test_after_cursor_returns_newer_posts(self):
+        url = reverse('index')
+        first = self.client.get(url).context['page']
+        second = self.client.get(
+            f'{url}?before={first.next_cursor}').context['page']
+        response = self.client.get(f'{url}?after={second.previous_cursor}')
+        self.assertEqual(list(response.context['page']), list(first))
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('index') + '?before=oops')
+        self.assertEqual(len(response.context['page']), 10)
+
 
 class PostPagesTests(TestCase):
     @classmethod
@@ -96,22 +173,45 @@ class PostPagesTests(TestCase):
         self.assertIsNotNone(response.context['page'][0].image)
 
     def test_index_page_cache(self):
-        """Testing correct caching the index template"""
-        response = self.authorized_client.get(reverse('index'))
-        last_post = response.content
-        post = Post.objects.create(
-            text='Новый пост',
-            author=self.user,
-        )
-        response = self.authorized_client.get(reverse('index'))
-        current_post = response.content
-        self.assertEqual(last_post, current_post, 'Caching is not working.')
+        """Лента берётся из кеша, пока её версия не изменилась"""
+        cache.clear()
+        response = self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('index'))
+        self.assertEqual(response.content, cached.content)
 
-        cache.delete('index_page')
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Новый пост')
 
-        response = self.authorized_client.get(reverse('index'))
-        current_post = response.content
-        self.assertNotEqual(current_post, post, 'Caching is not working.')
+    def test_index_cache_keeps_pages_apart(self):
+        cache.clear()
+        for index in range(10):
+            Post.objects.create(text=f'Запись {index}', author=self.user)
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('index') + '?page=2')
+        self.assertContains(response, 'Эта запись создана для проверки')
+
+    def test_index_cache_punches_edit_link_per_user(self):
+        cache.clear()
+        edit_url = reverse('post_edit',
+                           kwargs={'username': self.user.username,
+                                   'post_id': self.post.id})
+        other_client = Client()
+        other_client.force_login(User.objects.create_user(username='Other'))
+        self.assertContains(
+            self.authorized_client.get(reverse('index')), edit_url)
+        self.assertNotContains(other_client.get(reverse('index')), edit_url)
+        self.assertNotContains(self.client.get(reverse('index')), edit_url)
+
+    def test_index_cache_serves_stale_page_while_locked(self):
+        cache.clear()
+        self.client.get(reverse('index'))
+        feed_cache.bump_feed_version()
+        key = f'feed:index::{feed_cache.feed_version()}'
+        cache.add(f'{key}:lock', 1)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index'))
 
     def test_added_page_uses_correct_template(self):
         response = self.authorized_client.get(reverse('index'))
@@ -317,3 +417,1099 @@ class FollowTest(TestCase):
         response = self.authorized_client.get(reverse('follow_index'))
         page = response.context['page']
         self.assertEqual(len(page), 0)
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент не должны сканировать таблицы и сортировать в памяти."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.author = User.objects.create_user(username='Tolstoy')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        Follow.objects.create(user=self.user, author=self.author)
+        for index in range(13):
+            self.post = Post.objects.create(
+                text=f'Эта запись № {index} создана для проверки теста',
+                author=self.author,
+                group=self.group,
+            )
+
+    def assert_indexed_plans(self, name, url):
+        # Иначе главную отдаст кеш ленты и её запросы не попадут в проверку
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plan = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(view=name, sql=query['sql']):
+                for step in plan:
+                    self.assertFalse(
+                        step.startswith('SCAN') and 'USING' not in step,
+                        f'Полное сканирование таблицы: {plan}')
+                    self.assertNotIn('TEMP B-TREE', step)
+
+    def test_feed_queries_use_indexes(self):
+        feeds = {
+            'index': reverse('index'),
+            'group_posts': reverse(
+                'group_detail', kwargs={'slug': 'test-slug'}),
+            'profile': reverse(
+                'profile', kwargs={'username': self.author.username}),
+            'follow_index': reverse('follow_index'),
+        }
+        for name, url in feeds.items():
+            first = self.authorized_client.get(url).context['page']
+            self.assert_indexed_plans(name, url)
+            self.assert_indexed_plans(
+                name, f'{url}?before={first.next_cursor}')
+        self.assert_indexed_plans('post_view', reverse(
+            'post', kwargs={'username': self.author.username,
+                            'post_id': self.post.id}))
+        comment = Comment.objects.create(text='Комментарий',
+                                         author=self.user, post=self.post)
+        cursor = encode_cursor(comment, date_field='created')
+        url = reverse('post_comments',
+                      kwargs={'username': self.author.username,
+                              'post_id': self.post.id})
+        self.assert_indexed_plans('post_comments', f'{url}?after={cursor}')
+
+
+class FeedQueryCountTest(TestCase):
+    """Число запросов ленты не зависит от числа карточек на странице."""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        for index in range(10):
+            author = User.objects.create_user(username=f'author{index}')
+            group = Group.objects.create(
+                title=f'Группа {index}',
+                description='Тестовый текст',
+                slug=f'test-slug-{index}'
+            )
+            Follow.objects.create(user=self.user, author=author)
+            self.post = Post.objects.create(
+                text=f'Эта запись № {index} создана для проверки теста',
+                author=author,
+                group=group,
+            )
+
+    def test_feed_query_counts(self):
+        author = self.post.author
+        for _ in range(9):
+            Post.objects.create(text='Ещё запись', author=author,
+                                group=self.post.group)
+        AuthorStats.objects.for_user(author)
+        GroupStats.objects.for_group(self.post.group)
+        views = (
+            (reverse('index'), 4),
+            (reverse('group_detail',
+                     kwargs={'slug': self.post.group.slug}), 5),
+            (reverse('profile', kwargs={'username': author.username}), 5),
+            (reverse('follow_index'), 5),
+            (reverse('post', kwargs={'username': author.username,
+                                     'post_id': self.post.id}), 5),
+        )
+        for url, expected in views:
+            with self.subTest(url=url):
+                with self.assertNumQueries(expected):
+                    self.authorized_client.get(url)
+
+
+class CommentCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.post = Post.objects.create(
+            text='Эта запись создана для проверки теста',
+            author=self.user,
+        )
+
+    def add_comment(self, text='Комментарий'):
+        self.authorized_client.post(
+            reverse('add_comment',
+                    kwargs={'username': self.user.username,
+                            'post_id': self.post.id}),
+            {'text': text})
+
+    def test_comment_count_follows_add_and_delete(self):
+        self.add_comment()
+        self.add_comment()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        self.post.comment.first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_comment_badge_on_index(self):
+        self.add_comment()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Комментариев: 1')
+
+    def test_recount_comments_command(self):
+        self.add_comment()
+        self.add_comment()
+        Post.objects.update(comment_count=7)
+        call_command('recount_comments', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+    def test_recount_comments_refreshes_cards(self):
+        self.add_comment()
+        Post.objects.update(comment_count=5)
+        url = reverse('profile',
+                      kwargs={'username': self.post.author.username})
+        self.assertContains(self.client.get(url), 'Комментариев: 5')
+        call_command('recount_comments', stdout=StringIO())
+        response = self.client.get(url)
+        self.assertContains(response, 'Комментариев: 1')
+        self.assertNotContains(response, 'Комментариев: 5')
+
+
+class AuthorStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_posts_count_follows_create_and_delete(self):
+        Post.objects.create(text='Первая запись', author=self.user)
+        stats = AuthorStats.objects.for_user(self.user)
+        self.assertEqual(stats.posts_count, 1)
+        self.authorized_client.post(reverse('new_post'),
+                                    {'text': 'Вторая запись'})
+        post = Post.objects.create(text='Третья запись', author=self.user)
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 3)
+        post.delete()
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 2)
+
+    def test_profile_does_not_count_posts(self):
+        Post.objects.create(text='Первая запись', author=self.user)
+        AuthorStats.objects.for_user(self.user)
+        url = reverse('profile', kwargs={'username': self.user.username})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['posts_count'], 1)
+        self.assertFalse(any(
+            'COUNT' in query['sql'] and 'posts_post' in query['sql']
+            and 'author_id' in query['sql'] for query in queries))
+
+    def test_follow_counters_change_once(self):
+        author = User.objects.create_user(username='Tolstoy')
+        AuthorStats.objects.for_user(author)
+        AuthorStats.objects.for_user(self.user)
+        for view in ('profile_follow', 'profile_follow', 'profile_unfollow',
+                     'profile_unfollow', 'profile_follow'):
+            self.authorized_client.get(
+                reverse(view, kwargs={'username': author.username}))
+        author.stats.refresh_from_db()
+        self.user.stats.refresh_from_db()
+        self.assertEqual(author.stats.followers_count, 1)
+        self.assertEqual(author.stats.following_count, 0)
+        self.assertEqual(self.user.stats.following_count, 1)
+
+    def test_profile_shows_follow_counters_without_follow_queries(self):
+        author = User.objects.create_user(username='Tolstoy')
+        Follow.objects.create(user=self.user, author=author)
+        AuthorStats.objects.for_user(author)
+        url = reverse('profile', kwargs={'username': author.username})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertContains(response, 'Подписан: 0')
+        self.assertFalse(any('posts_follow' in query['sql']
+                             for query in queries))
+
+    def test_recount_follows_command(self):
+        author = User.objects.create_user(username='Tolstoy')
+        Follow.objects.create(user=self.user, author=author)
+        AuthorStats.objects.for_user(self.user)
+        AuthorStats.objects.for_user(author)
+        AuthorStats.objects.update(followers_count=5, following_count=5)
+        call_command('recount_follows', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            list(AuthorStats.objects.order_by('user_id').values_list(
+                'followers_count', 'following_count')),
+            [(0, 1), (1, 0)])
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.author = User.objects.create_user(username='Tolstoy')
+        self.old_post = Post.objects.create(text='Старый пост',
+                                            author=self.author)
+
+    def follow(self):
+        self.authorized_client.get(
+            reverse('profile_follow',
+                    kwargs={'username': self.author.username}))
+
+    def feed(self):
+        return list(self.authorized_client.get(
+            reverse('follow_index')).context['page'])
+
+    def test_follow_backfills_and_new_post_fans_out(self):
+        self.follow()
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.user).count(), 2)
+        self.assertEqual(self.feed(), [post, self.old_post])
+
+    def test_unfollow_prunes_timeline(self):
+        self.follow()
+        self.authorized_client.get(
+            reverse('profile_unfollow',
+                    kwargs={'username': self.author.username}))
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user).exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_pulled_on_read(self):
+        self.follow()
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.feed(), [post, self.old_post])
+        self.assertTrue(TimelineEntry.objects.filter(post=post).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_back_under_limit_keeps_unsent_posts(self):
+        self.follow()
+        other = User.objects.create_user(username='Chekhov')
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(self.feed(), [post, self.old_post])
+
+
+class PostCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        self.post = Post.objects.create(
+            text='Эта запись создана для проверки теста',
+            author=self.user,
+            group=self.group,
+        )
+        self.url = reverse('group_detail', kwargs={'slug': 'test-slug'})
+
+    def test_card_is_cached_by_post_version(self):
+        self.client.get(self.url)
+        self.assertIsNotNone(
+            cache.get(cards.card_key(self.post.id, self.post.version)))
+        self.post.text = 'Исправленный текст'
+        self.post.save()
+        self.assertEqual(self.post.version, 2)
+        self.assertContains(self.client.get(self.url), 'Исправленный текст')
+
+    def test_stale_save_keeps_comment_count(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        stale.text = 'Исправленный текст'
+        stale.save()
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.text, self.post.comment_count),
+            ('Исправленный текст', 1))
+
+    def test_stale_save_takes_next_version(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        stale.save()
+        self.assertEqual(stale.version, 3)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 3)
+
+    def test_comment_and_rename_refresh_card(self):
+        self.client.get(self.url)
+        self.authorized_client.post(
+            reverse('add_comment',
+                    kwargs={'username': self.user.username,
+                            'post_id': self.post.id}),
+            {'text': 'Комментарий'})
+        self.assertContains(self.client.get(self.url), 'Комментариев: 1')
+        self.user.username = 'LevTolstoy'
+        self.user.save()
+        self.assertContains(self.client.get(self.url), '@LevTolstoy')
+
+    def test_user_save_without_rename_keeps_card(self):
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 1)
+
+    def test_edit_link_is_not_cached_in_card(self):
+        edit_url = reverse('post_edit',
+                           kwargs={'username': self.user.username,
+                                   'post_id': self.post.id})
+        self.assertContains(self.authorized_client.get(self.url), edit_url)
+        self.assertNotContains(self.client.get(self.url), edit_url)
+
+
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        self.post = Post.objects.create(
+            text='Эта запись создана для проверки теста',
+            author=self.user,
+            image=SimpleUploadedFile(name='small.gif', content=small_gif,
+                                     content_type='image/gif'),
+        )
+
+    def test_missing_rendition_renders_placeholder(self):
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Превью ещё создаётся')
+        self.assertIsNone(thumbnails.lookup(self.post.image, 'card'))
+
+    def test_generated_rendition_replaces_placeholder(self):
+        self.client.get(reverse('index'))
+        thumbnails.generate(self.post.id, self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+        thumbnail = thumbnails.lookup(self.post.image, 'card')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, thumbnail.url)
+        self.assertNotContains(response, 'Превью ещё создаётся')
+
+    def test_generated_renditions_fill_srcset(self):
+        thumbnails.generate(self.post.id, self.post.image.name)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'type="image/webp"')
+        for width in thumbnails.CARD_WIDTHS:
+            thumbnail = thumbnails.lookup(
+                self.post.image, thumbnails.card_rendition(width, 'WEBP'))
+            self.assertEqual(thumbnail.width, width)
+            self.assertContains(response, f'{thumbnail.url} {width}w')
+        self.assertContains(response, 'width="960"')
+        self.assertContains(response, 'height="339"')
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_workers_generate_in_background(self):
+        done = threading.Event()
+        threads = []
+
+        def generate(post_id, name):
+            threads.append(threading.current_thread().name)
+            thumbnails._pending.discard((post_id, name))
+            done.set()
+
+        with mock.patch.object(thumbnails, 'generate', generate):
+            thumbnails.submit(self.post.id, self.post.image.name)
+            self.assertTrue(done.wait(5))
+        self.assertTrue(threads[0].startswith('thumbnails'))
+
+    def test_rolled_back_schedule_is_not_pending(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                thumbnails.schedule(self.post)
+                raise RuntimeError
+        self.assertNotIn((self.post.id, self.post.image.name),
+                         thumbnails._pending)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.hedgehog = Post.objects.create(
+            text='Ёжик в тумане ищет лошадь', author=self.user)
+        self.horse = Post.objects.create(
+            text='Лошадь бежит по полю', author=self.user)
+
+    def search(self, query, **params):
+        return self.client.get(reverse('search'), {'q': query, **params})
+
+    def test_search_matches_russian_words_and_prefixes(self):
+        cases = (
+            ('ежик', [self.hedgehog]),
+            ('ЛОШАД', [self.horse, self.hedgehog]),
+            ('туман лошадь', [self.hedgehog]),
+            ('крокодил', []),
+            ('"OR* NEAR(', []),
+        )
+        for query, expected in cases:
+            with self.subTest(query=query):
+                page = self.search(query).context['page']
+                self.assertCountEqual(list(page), expected)
+
+    def test_index_follows_edit_and_delete(self):
+        self.horse.text = 'Крокодил плывёт'
+        self.horse.save()
+        self.assertEqual(list(self.search('крокодил').context['page']),
+                         [self.horse])
+        self.assertEqual(list(self.search('бежит').context['page']), [])
+        self.horse.delete()
+        self.assertEqual(list(self.search('крокодил').context['page']), [])
+
+    def test_search_pages_by_cursor(self):
+        for index in range(12):
+            Post.objects.create(text=f'Лошадь номер {index}',
+                                author=self.user)
+        first = self.search('лошадь').context['page']
+        self.assertEqual(len(first), 10)
+        self.assertTrue(first.has_next())
+        second = self.search('лошадь', cursor=first.next_cursor)
+        second = second.context['page']
+        self.assertEqual(len(second), 4)
+        self.assertFalse(second.has_next())
+        self.assertFalse(set(first) & set(second))
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'ежик'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.hedgehog])
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries))
+
+    def test_rebuild_search_index_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_insert')
+        post = Post.objects.create(text='Крокодил', author=self.user)
+        self.assertEqual(list(self.search('крокодил').context['page']), [])
+        call_command('rebuild_search_index', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(self.search('крокодил').context['page']),
+                         [post])
+        self.assertEqual(list(self.search('лошадь').context['page']),
+                         [self.horse, self.hedgehog])
+        post = Post.objects.create(text='Ещё крокодил', author=self.user)
+        self.assertEqual(len(self.search('крокодил').context['page']), 2)
+
+
+class GroupPageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        self.other = Group.objects.create(
+            title='Другая группа',
+            description='Тестовый текст',
+            slug='other-slug'
+        )
+        self.url = reverse('group_detail', kwargs={'slug': 'test-slug'})
+
+    def test_all_group_posts_are_reachable(self):
+        for index in range(25):
+            Post.objects.create(text=f'Запись {index}', author=self.user,
+                                group=self.group)
+        seen = []
+        url = self.url
+        while url:
+            page = self.client.get(url).context['page']
+            seen += list(page)
+            url = (f'{self.url}?before={page.next_cursor}'
+                   if page.has_next() else None)
+        self.assertEqual(len(seen), 25)
+
+    def test_group_stats_follow_posts(self):
+        first = Post.objects.create(text='Первая', author=self.user,
+                                    group=self.group)
+        stats = GroupStats.objects.for_group(self.group)
+        GroupStats.objects.for_group(self.other)
+        second = Post.objects.create(text='Вторая', author=self.user,
+                                     group=self.group)
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.last_post_at),
+                         (2, second.pub_date))
+        second = Post.objects.get(pk=second.pk)
+        second.group = self.other
+        second.save()
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.last_post_at),
+                         (1, first.pub_date))
+        self.other.stats.refresh_from_db()
+        self.assertEqual(self.other.stats.posts_count, 1)
+        first.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.last_post_at), (0, None))
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Записей: 0')
+
+    def test_group_lookup_is_cached_until_group_changes(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('posts_group' in query['sql']
+                             and 'slug' in query['sql'] for query in queries))
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.client.get(self.url), 'Новое название')
+        self.group.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class GroupDirectoryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='StasBasov')
+        self.other = User.objects.create_user(username='Tolstoy')
+        self.groups = [
+            Group.objects.create(title=f'Группа {index}',
+                                 description='Тестовый текст',
+                                 slug=f'test-slug-{index}')
+            for index in range(3)
+        ]
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_directory_orders_by_activity_without_posts_table(self):
+        quiet, busy, empty = self.groups
+        Post.objects.create(text='Тихая', author=self.user, group=quiet)
+        for author in (self.user, self.other):
+            Post.objects.create(text='Шумная', author=author, group=busy)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('group_index'))
+        self.assertEqual(
+            [stats.group for stats in response.context['page']],
+            [busy, quiet, empty])
+        self.assertFalse(any('posts_post' in query['sql']
+                             for query in queries))
+        busy_stats = response.context['page'][0]
+        self.assertEqual(
+            (busy_stats.posts_24h, busy_stats.posts_7d,
+             busy_stats.posts_count, busy_stats.authors_count),
+            (2, 2, 2, 2))
+
+    def test_directory_links_to_next_page(self):
+        Group.objects.bulk_create(
+            Group(title=f'Ещё группа {index}', slug=f'more-{index}')
+            for index in range(views.GROUPS_PER_PAGE))
+        GroupStats.objects.bulk_create(
+            GroupStats(group=group)
+            for group in Group.objects.filter(slug__startswith='more-'))
+        response = self.client.get(reverse('group_index'))
+        self.assertContains(response, 'href="?page=2">Следующая')
+        response = self.client.get(reverse('group_index') + '?page=2')
+        self.assertContains(response, 'href="?page=1">&laquo; Предыдущая')
+
+    def test_delete_and_move_update_rollup(self):
+        first, second, _ = self.groups
+        post = Post.objects.create(text='Запись', author=self.user,
+                                   group=first)
+        Post.objects.create(text='Ещё', author=self.user, group=first)
+        post = Post.objects.get(pk=post.pk)
+        post.group = second
+        post.save()
+        self.assertEqual(
+            (self.stats(first).posts_24h, self.stats(first).authors_count),
+            (1, 1))
+        self.assertEqual(
+            (self.stats(second).posts_24h, self.stats(second).authors_count),
+            (1, 1))
+        post.delete()
+        self.assertEqual(
+            (self.stats(second).posts_24h, self.stats(second).authors_count),
+            (0, 0))
+
+    def test_compaction_folds_old_hours_and_expires_windows(self):
+        group = self.groups[0]
+        post = Post.objects.create(text='Запись', author=self.user,
+                                   group=group)
+        later = timezone.now() + datetime.timedelta(days=8)
+        self.assertEqual(activity.fold(now=later), 1)
+        activity.recount([self.stats(group)], now=later)
+        stats = self.stats(group)
+        self.assertEqual(
+            (stats.posts_24h, stats.posts_7d, stats.posts_count,
+             stats.authors_count),
+            (0, 0, 1, 1))
+        self.assertEqual(list(GroupActivity.objects.values_list(
+            'hour', 'posts_count')), [(activity.LIFETIME, 1)])
+        post.delete()
+        self.assertFalse(GroupActivity.objects.exists())
+        self.assertEqual(self.stats(group).authors_count, 0)
+
+    def test_compact_group_activity_command(self):
+        group = self.groups[0]
+        Post.objects.create(text='Запись', author=self.user, group=group)
+        GroupStats.objects.update(posts_24h=9, authors_count=9)
+        call_command('compact_group_activity', stdout=StringIO())
+        stats = self.stats(group)
+        self.assertEqual((stats.posts_24h, stats.authors_count), (1, 1))
+
+
+class CommentsPageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.post = Post.objects.create(
+            text='Эта запись создана для проверки теста',
+            author=self.user,
+        )
+        self.comments = [
+            Comment.objects.create(
+                text=f'Комментарий {index}', post=self.post,
+                author=User.objects.create_user(username=f'reader{index}'))
+            for index in range(25)
+        ]
+        self.kwargs = {'username': self.user.username,
+                       'post_id': self.post.id}
+
+    def test_post_page_shows_first_comments_and_more_link(self):
+        response = self.client.get(reverse('post', kwargs=self.kwargs))
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[:20])
+        comments = response.context['comments_page']
+        self.assertContains(
+            response, reverse('post_comments', kwargs=self.kwargs)
+            + f'?after={comments.next_cursor}')
+
+    def test_fragment_loads_rest_in_one_query(self):
+        first = self.client.get(
+            reverse('post', kwargs=self.kwargs)).context['comments_page']
+        url = (reverse('post_comments', kwargs=self.kwargs)
+               + f'?after={first.next_cursor}')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[20:])
+        self.assertContains(response, 'reader24')
+        self.assertNotContains(response, 'Показать ещё')
+        self.assertNotContains(response, '<html')
+
+    def test_fragment_of_missing_post_is_404(self):
+        response = self.client.get(reverse(
+            'post_comments',
+            kwargs={'username': self.user.username, 'post_id': 999}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_comment_renders_post_page_with_comments(self):
+        response = self.authorized_client.post(
+            reverse('add_comment', kwargs=self.kwargs), {'text': ''})
+        self.assertTrue(response.context['form'].errors)
+        self.assertEqual(len(response.context['comments']), 20)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.author = User.objects.create_user(username='Tolstoy')
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        self.post = Post.objects.create(text='Запись', author=self.author,
+                                        group=self.group)
+        AuthorStats.objects.for_user(self.author)
+        self.urls = {
+            'index': reverse('index'),
+            'group': reverse('group_detail', kwargs={'slug': 'test-slug'}),
+            'profile': reverse('profile',
+                               kwargs={'username': self.author.username}),
+            'post': reverse('post', kwargs={'username': self.author.username,
+                                            'post_id': self.post.id}),
+        }
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_return_304_without_rendering(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                etag = self.client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertLessEqual(len(queries), 1)
+
+    def test_etag_depends_on_viewer(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                self.assertNotEqual(self.client.get(url)['ETag'],
+                                    self.authorized_client.get(url)['ETag'])
+
+    def test_changes_invalidate_etag(self):
+        etags = {name: self.client.get(url)['ETag']
+                 for name, url in self.urls.items()}
+        Comment.objects.create(text='Комментарий', author=self.user,
+                               post=self.post)
+        Follow.objects.create(user=self.user, author=self.author)
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 200)
+
+    def test_unrelated_changes_keep_scoped_etags(self):
+        urls = {name: self.urls[name] for name in ('group', 'profile')}
+        etags = {name: self.authorized_client.get(url)['ETag']
+                 for name, url in urls.items()}
+        other = Post.objects.create(text='Чужая запись', author=self.user)
+        Comment.objects.create(text='Комментарий', author=self.user,
+                               post=other)
+        for name, url in urls.items():
+            with self.subTest(page=name):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 304)
+
+    def test_edit_in_group_changes_etags(self):
+        etags = {name: self.authorized_client.get(url)['ETag']
+                 for name, url in self.urls.items()}
+        self.post.text = 'Исправленная запись'
+        self.post.save()
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 200)
+
+    def test_missing_objects_are_404(self):
+        for url in (reverse('group_detail', kwargs={'slug': 'nope'}),
+                    reverse('profile', kwargs={'username': 'nobody'}),
+                    reverse('post', kwargs={'username': 'nobody',
+                                            'post_id': 999})):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='StasBasov')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.author = User.objects.create_user(username='Tolstoy')
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        self.post = Post.objects.create(text='Запись', author=self.author,
+                                        group=self.group)
+        self.urls = {
+            'index': reverse('index'),
+            'group': reverse('group_detail', kwargs={'slug': 'test-slug'}),
+            'profile': reverse('profile',
+                               kwargs={'username': self.author.username}),
+            'post': reverse('post', kwargs={'username': self.author.username,
+                                            'post_id': self.post.id}),
+        }
+
+    def test_repeated_anonymous_get_skips_database(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                first = self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    second = self.client.get(url)
+                self.assertEqual(len(queries), 0)
+                self.assertEqual(second.content, first.content)
+                self.assertIn('Cookie', second['Vary'])
+                self.assertNotIn('csrfmiddlewaretoken',
+                                 second.content.decode())
+
+    def test_feed_version_is_posts_tag(self):
+        version = feed_cache.feed_version()
+        self.assertEqual(page_cache.tag_version('posts'), version)
+        feed_cache.bump_feed_version()
+        self.assertEqual(page_cache.tag_version('posts'), version + 1)
+        # После вытеснения оба читают один заново заведённый счётчик
+        cache.delete(page_cache.TAG_KEY.format('posts'))
+        self.assertEqual(feed_cache.feed_version(),
+                         page_cache.tag_version('posts'))
+
+    def test_cached_page_answers_conditional_get(self):
+        etag = self.client.get(self.urls['index'])['ETag']
+        response = self.client.get(self.urls['index'],
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_authenticated_viewer_bypasses_cache(self):
+        self.client.get(self.urls['index'])
+        response = self.authorized_client.get(self.urls['index'])
+        self.assertContains(response, self.user.username)
+        self.assertNotContains(self.client.get(self.urls['index']),
+                               self.user.username)
+
+    def test_new_post_invalidates_pages(self):
+        for url in self.urls.values():
+            self.client.get(url)
+        Post.objects.create(text='Свежая запись', author=self.author,
+                            group=self.group)
+        for name in ('index', 'group', 'profile'):
+            with self.subTest(page=name):
+                self.assertContains(self.client.get(self.urls[name]),
+                                    'Свежая запись')
+
+    def test_follow_invalidates_only_author_pages(self):
+        for url in self.urls.values():
+            self.client.get(url)
+        Follow.objects.create(user=self.user, author=self.author)
+        for name in ('profile', 'post'):
+            with self.subTest(page=name):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(self.urls[name])
+                self.assertGreater(len(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.urls['index'])
+        self.assertEqual(len(queries), 0)
+
+    def test_unrelated_post_keeps_scoped_pages(self):
+        for url in self.urls.values():
+            self.client.get(url)
+        other = Post.objects.create(text='Чужая запись', author=self.user)
+        Comment.objects.create(post=other, author=self.user, text='Ответ')
+        self.assertContains(self.client.get(self.urls['index']),
+                            'Чужая запись')
+        for name in ('group', 'profile', 'post'):
+            with self.subTest(page=name):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(self.urls[name])
+                self.assertEqual(len(queries), 0)
+
+    def test_comment_invalidates_its_post_pages(self):
+        for url in self.urls.values():
+            self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Свежий комментарий')
+        self.assertContains(self.client.get(self.urls['post']),
+                            'Свежий комментарий')
+        for name in ('index', 'group', 'profile'):
+            with self.subTest(page=name):
+                self.assertContains(self.client.get(self.urls[name]),
+                                    'Комментариев: 1')
+
+
+class SyndicationFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Tolstoy')
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        self.post = Post.objects.create(text='Запись в ленте',
+                                        author=self.author, group=self.group)
+        self.urls = {
+            name: reverse(name, kwargs=kwargs)
+            for names, kwargs in (
+                (('index_rss', 'index_atom'), {}),
+                (('group_rss', 'group_atom'), {'slug': 'test-slug'}),
+                (('profile_rss', 'profile_atom'),
+                 {'username': self.author.username}),
+            )
+            for name in names
+        }
+
+    def test_feeds_list_posts(self):
+        for name, url in self.urls.items():
+            with self.subTest(feed=name):
+                response = self.client.get(url)
+                kind = 'atom' if name.endswith('atom') else 'rss'
+                self.assertIn(kind, response['Content-Type'])
+                self.assertContains(response, 'Запись в ленте')
+                self.assertContains(response, reverse('post', kwargs={
+                    'username': self.author.username,
+                    'post_id': self.post.id}))
+
+    def test_unchanged_feed_returns_304_in_one_query(self):
+        for name, url in self.urls.items():
+            with self.subTest(feed=name):
+                first = self.client.get(url)
+                for headers in (
+                        {'HTTP_IF_NONE_MATCH': first['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': first['Last-Modified']}):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(url, **headers)
+                    self.assertEqual(response.status_code, 304)
+                    self.assertEqual(len(queries), 1)
+
+    def test_unrelated_activity_keeps_304(self):
+        url = self.urls['profile_rss']
+        etag = self.client.get(url)['ETag']
+        other = User.objects.create_user(username='Chekhov')
+        post = Post.objects.create(text='Чужая запись', author=other)
+        Comment.objects.create(post=post, author=self.author, text='Ответ')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_edit_and_delete_refresh_feed(self):
+        url = self.urls['profile_rss']
+        # Последний пост не меняется: ETag двигают правка и число постов
+        Post.objects.create(text='Ещё запись', author=self.author)
+        for change in (self.edit_post, self.delete_post):
+            with self.subTest(change=change.__name__):
+                etag = self.client.get(url)['ETag']
+                change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def edit_post(self):
+        self.post.text = 'Исправленная запись'
+        self.post.save()
+
+    def delete_post(self):
+        self.post.delete()
+
+    def test_new_post_refreshes_cached_feed(self):
+        for url in self.urls.values():
+            self.client.get(url)
+        Post.objects.create(text='Свежая запись', author=self.author,
+                            group=self.group)
+        for name, url in self.urls.items():
+            with self.subTest(feed=name):
+                self.assertContains(self.client.get(url), 'Свежая запись')
+
+    def test_feed_is_limited_and_joins_authors(self):
+        url = self.urls['index_rss']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        Post.objects.bulk_create(
+            Post(text=f'Запись {index}', group=self.group,
+                 author=User.objects.create_user(username=f'author{index}'))
+            for index in range(feeds.FEED_ITEMS + 5))
+        with CaptureQueriesContext(connection) as more_queries:
+            response = self.client.get(url)
+        self.assertEqual(len(more_queries), len(queries))
+        self.assertEqual(response.content.decode().count('<item>'),
+                         feeds.FEED_ITEMS)
+
+    def test_missing_objects_are_404(self):
+        for url in (reverse('group_rss', kwargs={'slug': 'nope'}),
+                    reverse('profile_atom', kwargs={'username': 'nobody'})):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@mock.patch.object(sitemaps, 'SHARD_SIZE', 2)
+@mock.patch.object(sitemaps, 'CHUNK_SIZE', 1)
+class SitemapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Tolstoy')
+        self.group = Group.objects.create(
+            title='Тестовое название группы',
+            description='Тестовый текст',
+            slug='test-slug'
+        )
+        self.posts = [
+            Post.objects.create(text=f'Запись {index}', author=self.author,
+                                group=self.group)
+            for index in range(5)
+        ]
+
+    def shard_url(self, section, number):
+        return reverse('sitemap_section',
+                       kwargs={'section': section, 'number': number})
+
+    def shard(self, section, number):
+        response = self.client.get(self.shard_url(section, number))
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return b''.join(response.streaming_content).decode()
+        return response.content.decode()
+
+    def post_url(self, post):
+        return reverse('post', kwargs={'username': self.author.username,
+                                       'post_id': post.id})
+
+    def number(self, obj):
+        return (obj.pk - 1) // sitemaps.SHARD_SIZE
+
+    def test_index_lists_shards(self):
+        content = self.client.get(reverse('sitemap')).content.decode()
+        for post in self.posts:
+            self.assertIn(self.shard_url('posts', self.number(post)), content)
+        self.assertIn(self.shard_url('authors', self.number(self.author)),
+                      content)
+        self.assertIn(self.shard_url('groups', self.number(self.group)),
+                      content)
+
+    def test_shards_stream_urls_of_their_key_range(self):
+        content = self.shard('posts', self.number(self.posts[0]))
+        self.assertIn(self.post_url(self.posts[0]), content)
+        self.assertNotIn(self.post_url(self.posts[-1]), content)
+        self.assertIn(
+            reverse('profile', kwargs={'username': self.author.username}),
+            self.shard('authors', self.number(self.author)))
+        self.assertIn(reverse('group_detail', kwargs={'slug': 'test-slug'}),
+                      self.shard('groups', self.number(self.group)))
+
+    def test_unchanged_shard_is_served_from_cache(self):
+        number = self.number(self.posts[0])
+        self.shard('posts', number)
+        Post.objects.create(text='Свежая запись', author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.shard_url('posts', number))
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(queries), 1)
+
+    def test_changed_shard_is_rebuilt(self):
+        number = self.number(self.posts[0])
+        self.shard('posts', number)
+        self.shard('authors', self.number(self.author))
+        self.author.username = 'LevTolstoy'
+        self.author.save()
+        self.assertIn('/LevTolstoy/', self.shard('posts', number))
+        self.assertIn('/LevTolstoy/',
+                      self.shard('authors', self.number(self.author)))
+
+    def test_unknown_shards_are_404(self):
+        for url in (self.shard_url('nope', 0), self.shard_url('posts', 99)):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
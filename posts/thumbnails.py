@@ -0,0 +1,183 @@
+"""Фоновая подготовка превью картинок постов.
+
+Превью, заданные в RENDITIONS, создаёт пул потоков после коммита
+new_post и post_edit: картинка декодируется один раз, из неё делаются
+JPEG 960x339 для src и набор ширин в WebP (и AVIF, если Pillow умеет
+его сохранять) для srcset. Шаблонный тег только ищет готовое превью в KV
+store sorl-thumbnail и никогда не декодирует картинку в потоке запроса:
+если превью ещё нет, карточка выводит заглушку, а недостающее превью
+ставится в очередь. Когда превью готово, версия карточки поста растёт,
+и закешированная карточка с заглушкой перестаёт использоваться.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import feed_cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+Image.init()
+AVIF_SUPPORTED = 'AVIF' in Image.SAVE
+if AVIF_SUPPORTED:
+    # sorl-thumbnail знает расширения только JPEG, PNG, GIF и WebP
+    EXTENSIONS.setdefault('AVIF', 'avif')
+
+CARD_SIZE = (960, 339)
+CARD_WIDTHS = (320, 640, 960, 1920)
+CARD_FORMATS = ('AVIF', 'WEBP') if AVIF_SUPPORTED else ('WEBP',)
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp'}
+
+
+def card_rendition(width, image_format):
+    return f'card-{image_format.lower()}-{width}'
+
+
+RENDITIONS = {
+    'card': ('{}x{}'.format(*CARD_SIZE), CARD_OPTIONS),
+}
+for image_format in CARD_FORMATS:
+    for width in CARD_WIDTHS:
+        height = round(width * CARD_SIZE[1] / CARD_SIZE[0])
+        RENDITIONS[card_rendition(width, image_format)] = (
+            f'{width}x{height}', {**CARD_OPTIONS, 'format': image_format})
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class RenditionBackend(ThumbnailBackend):
+    def thumbnail_file(self, source, geometry_string, options):
+        """Файл превью с теми же именем и опциями, что у get_thumbnail."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage), options
+
+    def lookup(self, file_, geometry_string, **options):
+        """Как get_thumbnail, но только поиск в KV store, без генерации."""
+        thumbnail, options = self.thumbnail_file(
+            ImageFile(file_), geometry_string, options)
+        return default.kvstore.get(thumbnail)
+
+    def create_many(self, file_, renditions):
+        """Создаёт несколько превью, декодируя исходную картинку один раз."""
+        source = ImageFile(file_)
+        source_image = default.engine.get_image(source)
+        try:
+            image_info = default.engine.get_image_info(source_image)
+            source.set_size(default.engine.get_image_size(source_image))
+            default.kvstore.get_or_set(source)
+            for geometry_string, options in renditions:
+                thumbnail, options = self.thumbnail_file(
+                    source, geometry_string, options)
+                options['image_info'] = image_info
+                self._create_thumbnail(
+                    source_image, geometry_string, options, thumbnail)
+                default.kvstore.set(thumbnail, source)
+        finally:
+            default.engine.cleanup(source_image)
+
+
+backend = RenditionBackend()
+
+
+def lookup(image, rendition):
+    geometry, options = RENDITIONS[rendition]
+    return backend.lookup(image, geometry, **options)
+
+
+def card_image(image):
+    """Превью карточки: JPEG для src и наборы srcset по форматам.
+
+    Возвращает None, пока нет даже JPEG; недостающие превью ставит
+    в очередь.
+    """
+    fallback = lookup(image, 'card')
+    sources = []
+    complete = fallback is not None
+    for image_format in CARD_FORMATS:
+        srcset = []
+        for width in CARD_WIDTHS:
+            thumbnail = lookup(image, card_rendition(width, image_format))
+            if thumbnail is None:
+                complete = False
+            else:
+                srcset.append(f'{thumbnail.url} {thumbnail.width}w')
+        if srcset:
+            sources.append({'type': MIME_TYPES[image_format],
+                            'srcset': ', '.join(srcset)})
+    if not complete:
+        schedule(image.instance)
+    if fallback is None:
+        return None
+    return {'fallback': fallback, 'sources': sources}
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def generate(post_id, name):
+    """Создаёт все превью картинки и обновляет карточку поста."""
+    try:
+        backend.create_many(name, RENDITIONS.values())
+        if all(lookup(name, rendition) for rendition in RENDITIONS):
+            posts = Post.objects.filter(pk=post_id, image=name)
+            posts.update(version=F('version') + 1)
+            feed_cache.forget_posts(posts)
+    except Exception:
+        logger.exception('Не удалось создать превью %s', name)
+    finally:
+        with _lock:
+            _pending.discard((post_id, name))
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def schedule(post):
+    """Ставит создание превью картинки поста в очередь после коммита."""
+    if not post.image:
+        return
+    job = (post.id, post.image.name)
+    transaction.on_commit(lambda: submit(*job))
+
+
+def submit(post_id, name):
+    # Задача отмечается только после коммита: при откате транзакции
+    # колбэк не вызывается и отметка не остаётся навсегда
+    job = (post_id, name)
+    with _lock:
+        if job in _pending:
+            return
+        _pending.add(job)
+    if settings.THUMBNAIL_WORKERS:
+        executor().submit(generate, post_id, name)
+    else:
+        generate(post_id, name)
@@ -0,0 +1,105 @@
+"""Материализованные ленты подписок (fan-out-on-write).
+
+Новый пост раскладывается в TimelineEntry каждого подписчика автора,
+подписка дозаполняет ленту постами автора, отписка их убирает. Для
+авторов, у которых подписчиков больше TIMELINE_FANOUT_LIMIT, посты при
+записи не рассылаются: их подтягивает в ленту сам читатель при
+открытии /follow/ (fan-out-on-read), начиная с Follow.timeline_synced.
+"""
+import datetime
+import itertools
+
+from django.conf import settings
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .pagination import paginate
+
+BATCH_SIZE = 1000
+# Пост, сохранённый чуть раньше отметки, мог закоммититься позже неё
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def chunked(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    stats = AuthorStats.objects.for_user(post.author)
+    if stats.followers_count > settings.TIMELINE_FANOUT_LIMIT:
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True)
+    for chunk in chunked(followers.iterator()):
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=post.id,
+                           author_id=post.author_id, pub_date=post.pub_date)
+             for user_id in chunk),
+            ignore_conflicts=True,
+        )
+
+
+def pull(follow, since=None):
+    """Копирует посты автора в ленту подписчика, двигает отметку."""
+    posts = Post.objects.filter(author_id=follow.author_id)
+    if since is not None:
+        posts = posts.filter(pub_date__gte=since - SYNC_OVERLAP)
+    latest = follow.timeline_synced
+    rows = posts.order_by().values_list('id', 'pub_date').iterator()
+    for chunk in chunked(rows):
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=follow.user_id, post_id=post_id,
+                           author_id=follow.author_id, pub_date=pub_date)
+             for post_id, pub_date in chunk),
+            ignore_conflicts=True,
+        )
+        newest = max(pub_date for post_id, pub_date in chunk)
+        latest = newest if latest is None else max(latest, newest)
+    if latest != follow.timeline_synced:
+        Follow.objects.filter(pk=follow.pk).update(timeline_synced=latest)
+        follow.timeline_synced = latest
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты бывшего подписчика."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def settle(author_id):
+    """Дотягивает ленты, когда подписчиков стало TIMELINE_FANOUT_LIMIT.
+
+    Посты, записанные, пока подписчиков было больше лимита, не
+    разосланы, а catch_up такого автора больше не подтягивает.
+    """
+    followers = AuthorStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True).first()
+    if followers != settings.TIMELINE_FANOUT_LIMIT:
+        return
+    follows = Follow.objects.filter(author_id=author_id).only(
+        'id', 'user_id', 'author_id', 'timeline_synced')
+    for follow in follows:
+        pull(follow, since=follow.timeline_synced)
+
+
+def catch_up(user):
+    """Подтягивает в ленту новые посты авторов без рассылки при записи."""
+    follows = Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).only('id', 'user_id', 'author_id', 'timeline_synced')
+    for follow in follows:
+        pull(follow, since=follow.timeline_synced)
+
+
+def feed_page(request, user):
+    """Страница ленты подписок: один диапазон по индексу ленты."""
+    catch_up(user)
+    page = paginate(request, TimelineEntry.objects.for_feed().filter(
+        user=user), id_field='post_id')
+    page.object_list = [entry.post for entry in page.object_list]
+    return page
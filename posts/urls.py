@@ -1,15 +1,32 @@
 from django.urls import path
 
-from . import views
+from . import feeds, metrics, sitemaps, views
 
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('groups/', views.group_index, name='group_index'),
     path('group/<slug:slug>/',
          views.group_posts, name='group_detail'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search_posts, name='search'),
     path('justpage/', views.JustStaticPage.as_view()),
     path('follow/', views.follow_index, name='follow_index'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+    path('sitemap.xml', sitemaps.sitemap_index, name='sitemap'),
+    path('sitemap-<slug:section>-<int:number>.xml',
+         sitemaps.sitemap_section, name='sitemap_section'),
+    path('feeds/rss/', feeds.feed_view(feeds.PostsFeed), name='index_rss'),
+    path('feeds/atom/', feeds.feed_view(feeds.PostsAtomFeed),
+         name='index_atom'),
+    path('feeds/group/<slug:slug>/rss/',
+         feeds.feed_view(feeds.GroupFeed), name='group_rss'),
+    path('feeds/group/<slug:slug>/atom/',
+         feeds.feed_view(feeds.GroupAtomFeed), name='group_atom'),
+    path('feeds/<str:username>/rss/',
+         feeds.feed_view(feeds.AuthorFeed), name='profile_rss'),
+    path('feeds/<str:username>/atom/',
+         feeds.feed_view(feeds.AuthorAtomFeed), name='profile_atom'),
     path('<str:username>/follow/',
          views.profile_follow, name='profile_follow'),
     path('<str:username>/unfollow/',
@@ -23,6 +40,8 @@ urlpatterns = [
         views.post_edit,
         name='post_edit'
     ),
+    path('<str:username>/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
     path('<username>/<int:post_id>/comment',
          views.add_comment, name='add_comment'),
 
@@ -1,37 +1,66 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404
 from django.contrib.auth.decorators import login_required
-from .models import Post, Group, Follow
-from .forms import PostForm, CommentForm
 from django.core.paginator import Paginator
+from django.db import transaction
+from .models import Post, Follow, GroupStats
+from .forms import PostForm, CommentForm
+from .pagination import paginate
+from . import (etags, feed_cache, groups, page_cache, search, thumbnails,
+               timeline)
+from .cards import cards_for, punch_edit_links
+from .comments import comments_page
+from django.views.decorators.http import condition
 from django.views.generic.base import TemplateView
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+GROUPS_PER_PAGE = 50
+
 
+@page_cache.cache_for_anonymous('posts')
+@condition(etag_func=etags.feed_etag)
 def index(request):
-    post_list = Post.objects.all().order_by('-pub_date')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page, cards = feed_cache.cached_page(
+        'index', request.GET.urlencode(),
+        lambda: paginate(request, Post.objects.for_feed(),
+                         count=feed_cache.post_count()))
     return render(
         request,
         'posts/index.html',
-        {'page': page, }
+        {'page': page, 'cards': punch_edit_links(cards, request.user)}
     )
 
 
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    page = search.search_page(query, request.GET.get('cursor'))
+    return render(
+        request,
+        'posts/search.html',
+        {'query': query, 'page': page,
+         'cards': cards_for(page, request.user)}
+    )
+
+
+def group_index(request):
+    paginator = Paginator(GroupStats.objects.for_directory(), GROUPS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'groups.html', {'page': page})
 
-    posts = Post.objects.filter(group=group).order_by('-pub_date')[:10]
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
 
-    page = paginator.get_page(page_number)
+@page_cache.cache_for_anonymous('group:{slug}')
+@condition(etag_func=etags.group_etag)
+def group_posts(request, slug):
+    group = groups.get_group_or_404(slug)
+    stats = etags.group_stats(request, group)
+    page = paginate(request, Post.objects.for_feed().filter(group=group),
+                    count=stats.posts_count)
 
     return render(request, 'group.html',
-                  {'group': group, 'page': page})
+                  {'group': group, 'stats': stats, 'page': page,
+                   'cards': cards_for(page, request.user)})
 
 
 @login_required
@@ -41,6 +70,7 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect('index')
     return render(request, 'posts/new_post.html', {'form': form})
 
@@ -51,35 +81,54 @@ class JustStaticPage(TemplateView):
     template_name = 'posts/just_page.html'
 
 
+@page_cache.cache_for_anonymous('author:{username}')
+@condition(etag_func=etags.profile_etag)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    following = Follow.objects.filter(
-        user__id=request.user.id, author=user).exists()
-    posts = user.posts.all()
-    posts_count = len(posts)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-
-    page = paginator.get_page(page_number)
+    user, stats = etags.author_with_stats(request, username)
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author=user).exists()
+    page = paginate(request, Post.objects.for_feed().filter(author=user),
+                    count=stats.posts_count)
 
     return render(
         request, 'posts/profile.html',
         {'user_prof': user, 'page': page,
-         'posts_count': posts_count, 'following': following}
+         'cards': cards_for(page, request.user),
+         'stats': stats, 'posts_count': stats.posts_count,
+         'following': following}
     )
 
 
-def post_view(request, username, post_id):
-    user = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, id=post_id)
-    posts_count = Post.objects.filter(author=user).count()
-    comment_form = CommentForm()
-    comments = post.comment.all()
+def render_post_page(request, username, post_id, form):
+    """Страница поста с первой порцией комментариев."""
+    user, stats = etags.author_with_stats(request, username)
+    post = get_object_or_404(Post.objects.for_feed(), id=post_id)
+    page = comments_page(post.id, request.GET.get('after'),
+                         count=post.comment_count)
     return render(request, 'posts/post.html',
                   {'user_prof': user, 'post': post,
-                   'posts_count': posts_count, 'form': comment_form,
-                   'comments': comments}
-                  )
+                   'cards': cards_for([post], request.user),
+                   'stats': stats, 'posts_count': stats.posts_count,
+                   'form': form, 'comments': page.object_list,
+                   'comments_page': page})
+
+
+@page_cache.cache_for_anonymous('author:{username}', 'post:{post_id}')
+@condition(etag_func=etags.post_etag)
+def post_view(request, username, post_id):
+    return render_post_page(request, username, post_id, CommentForm())
+
+
+@page_cache.cache_for_anonymous('post:{post_id}')
+def post_comments(request, username, post_id):
+    """HTML-фрагмент со следующей порцией комментариев."""
+    page = comments_page(post_id, request.GET.get('after'))
+    # Пустая порция — повод проверить, что пост вообще существует
+    if not page and not Post.objects.filter(id=post_id).exists():
+        raise Http404('Пост не найден')
+    return render(request, 'posts/comment_list.html',
+                  {'comments': page.object_list, 'comments_page': page,
+                   'post_id': post_id, 'username': username})
 
 
 @login_required
@@ -91,7 +140,7 @@ def post_edit(request, username, post_id):
     form = PostForm(request.POST or None,
                     files=request.FILES or None, instance=post)
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        thumbnails.schedule(form.save())
         return redirect(
             "post",
             username=request.user.username, post_id=post_id)
@@ -108,16 +157,12 @@ def add_comment(request, username, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = get_object_or_404(Post, pk=post_id)
-        comment.save()
+        # Счётчик comment_count обновляется в той же транзакции
+        with transaction.atomic():
+            comment.save()
         return redirect('post',
                         username=request.user.username, post_id=post_id)
-    user = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, id=post_id)
-    posts_count = Post.objects.filter(author=user).count()
-    return render(request, 'posts/post.html',
-                  {'user_prof': user, 'post': post,
-                   'posts_count': posts_count, 'form': form, }
-                  )
+    return render_post_page(request, username, post_id, form)
 
 
 def page_not_found(request, exception):
@@ -137,14 +182,11 @@ def server_error(request):
 
 @login_required
 def follow_index(request):
-    user = request.user
-    authors = Follow.objects.filter(user=user).values('author')
-    posts = Post.objects.filter(author__in=authors).order_by('-pub_date')
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = timeline.feed_page(request, request.user)
+    paginator = page.paginator
     return render(request, 'posts/follow.html',
-                  {'page': page, 'paginator': paginator})
+                  {'page': page, 'paginator': paginator,
+                   'cards': cards_for(page, request.user)})
 
 
 @login_required
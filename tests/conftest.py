@@ -1,4 +1,14 @@
+import pytest
+
 pytest_plugins = [
+    'pytester',
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    # Общая in-memory база SQLite блокирует таблицы целиком и не ждёт
+    # освобождения: фоновый пул превью мешал бы очистке базы между тестами
+    settings.THUMBNAIL_WORKERS = 0
@@ -0,0 +1,67 @@
+from django.conf import settings
+
+LOOKUP = '''
+import pytest
+from django.http import Http404
+
+from posts import groups
+
+
+def lookup(count):
+    for number in range(count):
+        try:
+            groups.get_group_or_404(f'missing-{number}')
+        except Http404:
+            pass
+'''
+
+MARKED_TESTS = LOOKUP + '''
+
+@pytest.mark.django_db
+@pytest.mark.query_budget(2)
+def test_over_budget():
+    lookup(3)
+
+
+@pytest.mark.django_db
+@pytest.mark.query_budget(2)
+def test_within_budget():
+    lookup(2)
+'''
+
+UNMARKED_TESTS = LOOKUP + '''
+
+@pytest.mark.django_db
+def test_without_marker():
+    lookup(3)
+'''
+
+
+class TestQueryBudgetPlugin:
+
+    def run(self, pytester, monkeypatch, source, *args):
+        # Внутренний прогон в отдельном процессе: со своей тестовой базой
+        # и с импортом проекта из его корня
+        monkeypatch.setenv('PYTHONPATH', str(settings.BASE_DIR))
+        pytester.makepyfile(test_budget=source)
+        return pytester.runpytest_subprocess(
+            '-p', 'posts.pytest_plugin', '--ds=yatube.settings',
+            '-p', 'no:cacheprovider', *args)
+
+    def test_over_budget_fails_with_report(self, pytester, monkeypatch):
+        result = self.run(pytester, monkeypatch, MARKED_TESTS)
+        result.assert_outcomes(passed=1, failed=1)
+        result.stdout.fnmatch_lines([
+            '*test_over_budget*',
+            '*SQL-запросов: 3, бюджет: 2*',
+            '*3 x SELECT*posts_group*',
+            '*из posts/groups.py:* in get_group_or_404*',
+        ])
+
+    def test_option_sets_budget_for_unmarked_tests(self, pytester,
+                                                   monkeypatch):
+        result = self.run(pytester, monkeypatch, UNMARKED_TESTS)
+        result.assert_outcomes(passed=1)
+        result = self.run(pytester, monkeypatch, UNMARKED_TESTS,
+                          '--query-budget=2')
+        result.assert_outcomes(failed=1)
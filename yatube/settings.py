@@ -49,11 +49,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первой: время, SQL и кеш считаются для всего запроса
+    'posts.metrics.MetricsMiddleware',
+    'posts.queries.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Отдаёт анонимам готовые страницы до сессий и аутентификации
+    'posts.page_cache.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'posts.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -136,6 +142,62 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Обёртка считает попадания и промахи для /metrics
+        'BACKEND': 'posts.metrics.MeteredCache',
+        'OPTIONS': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
     }
 }
+
+# Авторы, у которых подписчиков больше, не рассылают посты по лентам
+# подписчиков при публикации: лента подтягивает их при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Потоки, создающие превью картинок постов в фоне; 0 — превью
+# создаются сразу после коммита в том же потоке
+THUMBNAIL_WORKERS = 2
+
+# Каталог, куда воркеры сбрасывают метрики для /metrics.
+# None — /metrics показывает только свой процесс
+METRICS_DIR = None
+# Кому открыт /metrics: адреса сборщика или токен в заголовке
+# «Authorization: Bearer ...». По умолчанию закрыт для всех
+METRICS_ALLOWED_IPS = ()
+METRICS_TOKEN = None
+
+# Поиск N+1 и медленных запросов: в разработке (DEBUG) проверяется
+# каждый запрос, в продакшене — доля QUERY_INSPECTOR_SAMPLE_RATE.
+# Отчёты идут JSON-строками в логгер posts.queries
+QUERY_INSPECTOR_SAMPLE_RATE = 0.01
+QUERY_INSPECTOR_REPEAT_THRESHOLD = 5
+QUERY_INSPECTOR_SLOW_MS = 100
+
+# Профилирование запросов с заголовком X-Profile: интервал сэмплов
+# в секундах и срок жизни токена из команды profiling_token. Снимки
+# содержат SQL и пути к исходникам: они лежат вне MEDIA_ROOT и
+# скачиваются только из админки
+PROFILING_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_ROOT = os.path.join(BASE_DIR, 'profiles')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'queries': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'posts.queries': {
+            'handlers': ['queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}